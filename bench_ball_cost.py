@@ -0,0 +1,77 @@
+import os
+import time
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.test_settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from simulator.models import Ball, InningsScore, PlayingSquad
+from simulator.services.generator import create_dummy_match, setup_match_squads
+from simulator.services.engine import SimulationEngine
+from simulator.services.live_store import get_live_store
+
+INNINGS_LENGTHS = [50, 300, 3000]
+TIMED_BALLS = 200
+
+
+class NoWicketEngine(SimulationEngine):
+    """Keeps the innings going so every timed ball sees the same innings length."""
+
+    def _determine_outcome(self, match, innings_score, over_number, ball_number):
+        outcome = super()._determine_outcome(match, innings_score, over_number, ball_number)
+        while outcome['is_wicket']:
+            outcome = super()._determine_outcome(match, innings_score, over_number, ball_number)
+        return outcome
+
+
+def prefill_innings(match, balls):
+    # Write an innings of `balls` deliveries directly, as a long Test innings would leave it
+    teams = list(match.teams.all())
+    batters = [sq.player for sq in PlayingSquad.objects.filter(match=match, team=teams[0])]
+    bowlers = [sq.player for sq in PlayingSquad.objects.filter(match=match, team=teams[1])]
+    rows = []
+    for i in range(balls):
+        rows.append(Ball(
+            match=match, innings=1, over_number=i // 6, ball_number=i % 6 + 1,
+            striker=batters[0], non_striker=batters[1], bowler=bowlers[i % len(bowlers)],
+            runs_batter=i % 2, total_runs=i % 2,
+        ))
+    Ball.objects.bulk_create(rows, batch_size=500)
+    overs, rem = divmod(balls, 6)
+    InningsScore.objects.create(
+        match=match, team=teams[0], innings=1,
+        total_runs=sum(r.total_runs for r in rows), total_overs=float(f"{overs}.{rem}"),
+    )
+
+
+def run():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"{'innings balls':>14} {'ms/ball':>10} {'queries/ball':>14}")
+        for length in INNINGS_LENGTHS:
+            match = create_dummy_match()
+            setup_match_squads(match)
+            match.is_live = True
+            match.save()
+            prefill_innings(match, length)
+            # Watched, so every ball's payload is built and encoded as it would be live
+            get_live_store().add_viewer(match.id)
+
+            engine = NoWicketEngine()
+            engine.simulate_ball(match)  # load state once; not part of the per-ball cost
+
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                for _ in range(TIMED_BALLS):
+                    engine.simulate_ball(match)
+                elapsed = time.perf_counter() - start
+
+            print(f"{length:>14} {elapsed / TIMED_BALLS * 1000:>10.3f} {len(ctx.captured_queries) / TIMED_BALLS:>14.1f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    run()
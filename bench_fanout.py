@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import asyncio
+import django
+import msgpack
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.test_settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from simulator.consumers import MatchConsumer, MatchStream
+from simulator.services.encoding import dumps
+from simulator.services.generator import create_dummy_match, setup_match_squads
+from simulator.services.engine import SimulationEngine
+
+SUBSCRIBER_COUNTS = [1, 100, 1000, 5000]
+TIMED_BALLS = 5
+
+
+class LegacyConsumer(MatchConsumer):
+    """The consumer as it was: every socket serializes the payload itself."""
+
+    async def match_update(self, event):
+        await self.send(text_data=json.dumps(event['payload']))
+
+
+def make_consumers(cls, count, version):
+    consumers = []
+    for _ in range(count):
+        consumer = cls()
+        consumer.stream = MatchStream(consumer, 1, version)
+        consumer.stream.min_interval = 0 # Every ball is its own frame here
+
+        async def send(text_data=None, bytes_data=None):
+            pass # Stands in for the socket write, which costs the same either way
+        consumer.send = send
+        consumers.append(consumer)
+    return consumers
+
+
+async def time_fan_out(cls, count, version, messages):
+    """
+    CPU per ball to deliver `messages` to `count` consumers. Transport is
+    modelled the way channels_redis does it: the message is packed with
+    msgpack once per ball and unpacked by every receiving channel.
+    """
+    consumers = make_consumers(cls, count, version)
+    start = time.process_time()
+    for message in messages:
+        packed = msgpack.packb(message, use_bin_type=True)
+        for consumer in consumers:
+            await consumer.match_update(msgpack.unpackb(packed, raw=False))
+    return (time.process_time() - start) / len(messages)
+
+
+def capture_balls():
+    """Real payloads for consecutive balls of a generated match."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        engine = SimulationEngine()
+        payloads = []
+        for _ in range(TIMED_BALLS + 1):
+            delivery = engine._advance(match)
+            engine.states[match.id].pending_balls = []
+            payloads.append(engine._build_delivery_payload(match, delivery))
+        return payloads
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def run():
+    payloads = capture_balls()
+    legacy = [{'type': 'match_update', 'payload': p} for p in payloads[1:]]
+    # What the engine sends now: encoded once per ball (delta text omitted,
+    # v1 sockets write the full text)
+    encoded = [{'type': 'match_update', 'match_id': 1, 'seq': i + 1, 'text': dumps(p), 'delta_text': None} for i, p in enumerate(payloads[1:])]
+
+    print(f"{'subscribers':>12} {'dumps per socket':>18} {'encode once':>14}   (CPU ms per ball)")
+    for count in SUBSCRIBER_COUNTS:
+        before = asyncio.run(time_fan_out(LegacyConsumer, count, 1, legacy))
+        start = time.process_time()
+        for p in payloads[1:]:
+            dumps(p)
+        encode = (time.process_time() - start) / TIMED_BALLS
+        after = asyncio.run(time_fan_out(MatchConsumer, count, 1, encoded)) + encode
+        print(f"{count:>12} {before * 1000:>18.2f} {after * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,152 @@
+import os
+import time
+import tempfile
+import statistics
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.test_settings')
+django.setup()
+
+from django.db import connection
+from django.db.models import Count
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_test_environment
+from simulator.models import Ball, Match
+from simulator.services.engine import SimulationEngine
+from simulator.services.generator import create_dummy_match, setup_match_squads
+from simulator.services.leases import MatchLease
+from simulator.services.live_store import get_live_store
+from simulator.services.scheduler import BallScheduler
+
+MATCH_COUNTS = [10, 50, 200]
+THREAD_COUNTS = [1, 4]
+TIMED_TICKS = 10
+# Round trip added to every query, as with a database on another host
+QUERY_LATENCY = 0.001
+# One match takes this long over each ball (e.g. a stalled connection)
+SLOW_SECONDS = 2.5
+# Real time each blocked-match run lasts; every match bowls once a second
+BLOCKED_WINDOW = 10.0
+
+
+def add_latency(execute, sql, params, many, context):
+    time.sleep(QUERY_LATENCY)
+    return execute(sql, params, many, context)
+
+
+def with_latency(sender, connection, **kwargs):
+    connection.execute_wrappers.append(add_latency)
+
+
+class SlowEngine(SimulationEngine):
+    def __init__(self, slow_id):
+        super().__init__()
+        self.slow_id = slow_id
+
+    def simulate_tick(self, matches, **kwargs):
+        if any(match.id == self.slow_id for match in matches):
+            time.sleep(SLOW_SECONDS)
+        return super().simulate_tick(matches, **kwargs)
+
+
+def go_live(count):
+    Match.objects.update(is_live=False)
+    ids = list(Match.objects.order_by('id').values_list('id', flat=True)[:count])
+    Match.objects.filter(id__in=ids).update(is_live=True, seconds_per_ball=1.0)
+    return ids
+
+
+def ball_counts(ids):
+    return dict(Ball.objects.filter(match_id__in=ids).values_list('match_id').annotate(Count('id')))
+
+
+def time_ticks(count, threads):
+    """Wall-clock ms per tick for `count` watched matches that are all due every tick."""
+    go_live(count)
+
+    now = [0.0]
+    scheduler = BallScheduler(clock=lambda: now[0], log=print, lease=MatchLease(owner=f'bench-{count}-{threads}'), threads=threads)
+    run_tick(scheduler) # Claims the matches and loads their state; not timed
+    start = time.perf_counter()
+    for _ in range(TIMED_TICKS):
+        now[0] += 1.0
+        run_tick(scheduler)
+    elapsed = (time.perf_counter() - start) / TIMED_TICKS
+    stop(scheduler)
+    return elapsed
+
+
+def run_tick(scheduler):
+    # With a pool run_once returns at once; the tick ends when every chunk is back
+    while True:
+        scheduler.wakeup.clear()
+        scheduler.run_once()
+        if not scheduler.in_flight:
+            return
+        scheduler.wakeup.wait()
+
+
+def stop(scheduler):
+    # Let running chunks finish before their leases go
+    if scheduler.pool is not None:
+        scheduler.pool.shutdown()
+    scheduler.release_all()
+
+
+def time_blocked(count, threads):
+    """
+    Median seconds between balls of the other `count` - 1 matches, and of the
+    slow one, over BLOCKED_WINDOW seconds of real time.
+    """
+    ids = go_live(count)
+    before = ball_counts(ids)
+    scheduler = BallScheduler(engine=SlowEngine(ids[0]), log=print, lease=MatchLease(owner=f'bench-slow-{count}-{threads}'), threads=threads)
+    end = time.monotonic() + BLOCKED_WINDOW
+    while time.monotonic() < end:
+        scheduler.wakeup.clear()
+        delay = scheduler.run_once()
+        scheduler.wakeup.wait(min(delay, max(0.0, end - time.monotonic())))
+    stop(scheduler)
+    after = ball_counts(ids)
+    intervals = [BLOCKED_WINDOW / max(after.get(match_id, 0) - before.get(match_id, 0), 1) for match_id in ids]
+    return statistics.median(intervals[1:]), intervals[0]
+
+
+def run():
+    # Threads need their own connections, so use an on-disk test database
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench_tick.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        first = create_dummy_match()
+        for i in range(max(MATCH_COUNTS)):
+            # The same two teams every time; only the squads are per match
+            match = first if i == 0 else Match.objects.create(tournament=first.tournament, date=first.date, match_type='T20')
+            match.teams.set(first.teams.all())
+            setup_match_squads(match)
+            # Watched, so every ball is encoded and recorded as it would be live
+            get_live_store().add_viewer(match.id)
+
+        for latency in (0.0, QUERY_LATENCY):
+            if latency:
+                connection.execute_wrappers.append(add_latency)
+                connection_created.connect(with_latency)
+            print(f"\nquery latency {latency * 1000:.0f} ms")
+            print(f"{'live matches':>13}" + "".join(f"{f'{t} thread(s)':>14}" for t in THREAD_COUNTS) + "   (ms per tick)")
+            for count in MATCH_COUNTS:
+                row = [time_ticks(count, threads) for threads in THREAD_COUNTS]
+                print(f"{count:>13}" + "".join(f"{ms * 1000:>14.1f}" for ms in row))
+
+        print(f"\none match takes {SLOW_SECONDS} s a ball, the rest are due every 1.0 s")
+        print(f"{'live matches':>13}" + "".join(f"{f'{t} thread(s)':>20}" for t in THREAD_COUNTS) + "   (s between balls: others / slow)")
+        for count in MATCH_COUNTS[:2]:
+            row = [time_blocked(count, threads) for threads in THREAD_COUNTS]
+            print(f"{count:>13}" + "".join(f"{f'{others:.2f} / {slow:.2f}':>20}" for others, slow in row))
+    finally:
+        connection_created.disconnect(with_latency)
+        if add_latency in connection.execute_wrappers:
+            connection.execute_wrappers.remove(add_latency)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    run()
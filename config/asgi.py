@@ -7,14 +7,15 @@ django.setup()
 
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
+from simulator.lifespan import SimulationLifespan
 from simulator.middleware import TokenAuthMiddleware
 import simulator.routing
 
-application = ProtocolTypeRouter({
+application = SimulationLifespan(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": TokenAuthMiddleware(
         URLRouter(
             simulator.routing.websocket_urlpatterns
         )
     ),
-})
+}))
@@ -45,7 +45,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'simulator.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -112,6 +112,44 @@ else:
         },
     }
 
+# Latest state of each live match, sent to WebSocket clients when they connect
+if 'REDIS_URL' in os.environ:
+    LIVE_STORE = {
+        "BACKEND": "simulator.services.live_store.RedisLiveStore",
+        "CONFIG": {
+            "url": os.environ.get('REDIS_URL'),
+        },
+    }
+else:
+    LIVE_STORE = {
+        "BACKEND": "simulator.services.live_store.InMemoryLiveStore",
+    }
+
+# How often the simulation scheduler re-reads the set of live matches from the database
+SIMULATION_RECONCILE_SECONDS = float(os.environ.get('SIMULATION_RECONCILE_SECONDS', 5))
+
+# Where the web server runs the simulation: 'thread' (a background thread
+# started by the app), 'asyncio' (on the ASGI event loop, see
+# simulator/lifespan.py) or 'off' (a separate `run_simulation` worker)
+SIMULATION_SCHEDULER = os.environ.get('SIMULATION_SCHEDULER', 'thread')
+
+# How long a simulation worker's claim on a match lasts without renewal;
+# a crashed worker's matches are taken over after this
+SIMULATION_LEASE_SECONDS = float(os.environ.get('SIMULATION_LEASE_SECONDS', 30))
+
+# Threads a scheduler simulates due matches on. With more than one, a slow
+# match only delays the matches sharing its thread, not the whole scheduler.
+# SQLite serializes writers, so there extra threads cost throughput
+SIMULATION_THREADS = int(os.environ.get('SIMULATION_THREADS', 1))
+
+# Outbox of ball messages waiting for the channel layer: the most it holds
+# (the oldest are dropped beyond that) and how many are sent per batch
+BROADCAST_QUEUE_SIZE = int(os.environ.get('BROADCAST_QUEUE_SIZE', 10000))
+BROADCAST_BATCH_SIZE = int(os.environ.get('BROADCAST_BATCH_SIZE', 500))
+
+# Most updates a WebSocket client is sent per second per match; faster balls are coalesced
+WS_MAX_UPDATES_PER_SECOND = float(os.environ.get('WS_MAX_UPDATES_PER_SECOND', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -5,3 +5,7 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer"
     },
 }
+
+LIVE_STORE = {
+    "BACKEND": "simulator.services.live_store.InMemoryLiveStore",
+}
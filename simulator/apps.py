@@ -16,57 +16,23 @@ def log_debug(msg):
 
 def start_simulation_loop():
     # Deferred import to avoid registry not ready issues
-    from simulator.models import Match
-    from simulator.services.engine import SimulationEngine
+    from simulator.services.scheduler import BallScheduler
 
     # Wait for DB to be potentially ready
     time.sleep(2)
-    
-    engine = SimulationEngine()
-    last_updates = {}
-    engine = SimulationEngine()
-    last_updates = {}
-    log_debug("Background Simulation Loop Started")
 
-    while True:
-        try:
-            # Check for generic stop signal if needed (e.g. file existence)
-            # For now, infinite loop daemon
-            
-            # We must wrap DB access in try/except or ensure connection validity
-            # but Django usually handles persistent connection in threads okay-ish
-            # if we close old ones.
-            from django.db import connection
-            connection.close_if_unusable_or_obsolete()
-            
-            live_matches = Match.objects.filter(is_live=True, match_ended=False)
-            
-            if not live_matches.exists():
-                # print("No live matches...")
-                time.sleep(1)
-                continue
-            
-            now = time.time()
-            for match in live_matches:
-                # log_debug(f"Checking Match {match.id}")
-                last_update = last_updates.get(match.id, 0)
-                if now - last_update >= match.seconds_per_ball:
-                    log_debug(f"Simulating ball for Match {match.id}")
-                    engine.simulate_ball(match)
-                    last_updates[match.id] = now
-            
-            time.sleep(0.1)
-        except Exception as e:
-            log_debug(f"Simulation Loop Error: {e}")
-            import traceback
-            traceback.print_exc()
-            time.sleep(1)
+    scheduler = BallScheduler(log=log_debug, log_ticks=True)
+    log_debug("Background Simulation Loop Started")
+    scheduler.run_forever()
 
 class SimulatorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'simulator'
 
     def ready(self):
+        # Connects the token cache invalidation signals in every process
+        from simulator import authentication  # noqa: F401
+
         import sys
         import os
         import threading
@@ -88,13 +54,19 @@ class SimulatorConfig(AppConfig):
         from django.core.management import call_command
         import time
         
+        from django.conf import settings
+        # In 'asyncio' mode the ASGI app runs the scheduler on its own event
+        # loop (simulator/lifespan.py); in 'off' mode a worker runs it
+        run_thread = getattr(settings, 'SIMULATION_SCHEDULER', 'thread') == 'thread'
+
         def run_startup_tasks():
             # Wait a bit for DB to be configured
             time.sleep(5)
             try:
                 log_debug("Running startup tasks (Admin Init + Simulation)...")
                 call_command('init_admin')
-                start_simulation_loop()
+                if run_thread:
+                    start_simulation_loop()
             except Exception as e:
                 log_debug(f"Startup Error: {e}")
 
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """
+    Token key -> (user, token), shared by the WebSocket middleware and the
+    REST authentication class so reconnect storms do not turn into one
+    authtoken query per connection. Entries expire after `ttl` seconds and
+    the least recently used ones are dropped beyond `max_size`. Unknown keys
+    are cached too (as None), so a client retrying a bad token is cheap.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """(hit, value); value is (user, token) or None for an unknown key."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key, (_, value) in list(self._entries.items()):
+                if value is not None and value[0].pk == user_id:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+    max_size=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+)
+
+
+def lookup_token(key):
+    """(user, token) for a token key, or None; reads the database only on a cache miss."""
+    hit, value = token_cache.get(key)
+    if hit:
+        return value
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+        value = (token.user, token)
+    except Token.DoesNotExist:
+        value = None
+    token_cache.set(key, value)
+    return value
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for DRF's TokenAuthentication backed by token_cache."""
+
+    def authenticate_credentials(self, key):
+        value = lookup_token(key)
+        if value is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, token = value
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, token)
+
+
+# A deleted or regenerated token must stop working at once, not after the TTL
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
@@ -1,5 +1,197 @@
 import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from simulator.models import Match
+from simulator.services.engine import SimulationEngine
+from simulator.services.encoding import dumps, snapshot_text
+from simulator.services.live_store import get_live_store
+
+# v1: a full BALL_UPDATE per ball. v2: a SNAPSHOT on connect, then BALL_DELTA
+# messages numbered by `seq` (see services/delta.py).
+PROTOCOL_VERSION = 2
+
+# Matches one multiplexed connection may follow at once
+MAX_SUBSCRIPTIONS = 50
+
+@database_sync_to_async
+def load_snapshot(match_id):
+    """
+    Rebuild a snapshot from the database when the live store has none (e.g.
+    after a restart) and keep it there for the next client.
+    Returns (seq, encoded payload); the payload is 'null' before the first ball.
+    """
+    match = Match.objects.filter(id=match_id).select_related('tournament').first()
+    if match is None:
+        return 0, dumps(None)
+    seq, payload = SimulationEngine().build_snapshot(match)
+    text = dumps(payload)
+    get_live_store().add_snapshot(match_id, seq, text)
+    return seq, text
+
+async def get_snapshot(match_id):
+    snapshot = await sync_to_async(get_live_store().get_snapshot, thread_sensitive=False)(match_id)
+    if snapshot is None:
+        snapshot = await load_snapshot(match_id)
+    return snapshot
+
+async def add_viewer(match_id):
+    await sync_to_async(get_live_store().add_viewer, thread_sensitive=False)(match_id)
+
+async def remove_viewer(match_id):
+    await sync_to_async(get_live_store().remove_viewer, thread_sensitive=False)(match_id)
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def requested_version(scope):
+    # Protocol version requested with ?v=2; anything else gets v1
+    params = parse_qs(scope.get('query_string', b'').decode())
+    return min(parse_int(params.get('v', ['1'])[0]) or 1, PROTOCOL_VERSION), params
+
+class MatchStream:
+    """
+    One match as followed by one socket: remembers the last seq the client
+    has and decides whether each ball goes out as an update, a delta or a
+    snapshot. Messages are already encoded; this only picks and sends them.
+
+    Updates are sent at most WS_MAX_UPDATES_PER_SECOND times a second. Balls
+    that arrive faster are coalesced: only the newest one is held, and the
+    next frame is its delta if the client has the ball before it, or else
+    the newest state. A slow client therefore never builds up a queue on
+    the channel layer or in the consumer.
+    """
+
+    def __init__(self, consumer, match_id, version):
+        self.consumer = consumer
+        self.match_id = int(match_id)
+        self.version = version
+        # Sequence number of the last ball this client has
+        self.seq = 0
+
+        self.min_interval = 1.0 / getattr(settings, 'WS_MAX_UPDATES_PER_SECOND', 5)
+        self.last_sent = 0.0
+        # Newest ball not yet sent; older ones it replaced are never needed,
+        # but if one of them had no delta the client must get a snapshot
+        self.pending = None
+        self.pending_resync = False
+        self.flush_task = None
+
+    def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+    async def start(self, since=None):
+        # A reconnecting client passes the last seq it saw as `since`
+        if since is not None:
+            await self.resume(since)
+        elif self.version >= 2:
+            await self.send_current_snapshot()
+        else:
+            await self.send_current_update()
+
+    async def resume(self, since):
+        """
+        Send the balls bowled after `since` from the live store's ring, or,
+        if they are no longer all there, the latest state in one message.
+        """
+        missed = await sync_to_async(get_live_store().balls_since, thread_sensitive=False)(self.match_id, since)
+        if self.version >= 2:
+            # Deltas only chain if the engine diffed every one of them
+            if missed is None or any(delta_text is None for _, _, delta_text in missed):
+                await self.send_current_snapshot()
+                return
+            self.seq = since
+            for seq, _, delta_text in missed:
+                self.seq = seq
+                await self.consumer.send(text_data=delta_text)
+            return
+
+        if missed is None:
+            # v1 messages are full updates, so the latest one is a snapshot
+            await self.send_current_update()
+            return
+        self.seq = since
+        for seq, text, _ in missed:
+            self.seq = seq
+            await self.consumer.send(text_data=text)
+
+    async def send_current_update(self):
+        # v1: the latest BALL_UPDATE as stored, so the client need not poll the REST API
+        seq, text = await get_snapshot(self.match_id)
+        if text != 'null':
+            self.seq = seq
+            await self.consumer.send(text_data=text)
+
+    async def send_current_snapshot(self):
+        seq, payload_text = await get_snapshot(self.match_id)
+        await self.send_snapshot(seq, payload_text)
+
+    async def send_snapshot(self, seq, payload_text):
+        self.seq = seq
+        await self.consumer.send(text_data=snapshot_text(self.match_id, seq, payload_text, self.version))
+
+    # The engine has already encoded the message text once for every
+    # subscriber; nothing is serialized here.
+    async def update(self, event):
+        if self.already_sent(event, self.pending_resync):
+            return
+        if event['delta_text'] is None:
+            self.pending_resync = True
+        self.pending = event
+        if self.flush_task is not None:
+            return # A frame is already scheduled and will include this ball
+        wait = self.last_sent + self.min_interval - time.monotonic()
+        if wait <= 0:
+            await self.flush()
+        else:
+            self.flush_task = asyncio.ensure_future(self.flush_later(wait))
+
+    async def flush_later(self, wait):
+        await asyncio.sleep(wait)
+        self.flush_task = None
+        await self.flush()
+
+    def already_sent(self, event, resync=False):
+        # The client got this ball in its snapshot or backfill. A lower seq
+        # is only new when the match was reset: it comes without a delta,
+        # or after one that did
+        if event['seq'] == self.seq:
+            return True
+        return event['seq'] < self.seq and event['delta_text'] is not None and not resync
+
+    async def flush(self):
+        latest, resync = self.pending, self.pending_resync
+        self.pending, self.pending_resync = None, False
+        # A snapshot or backfill may have been sent while it was held
+        if latest is None or self.already_sent(latest, resync):
+            return
+        self.last_sent = time.monotonic()
+        seq, delta_text = latest['seq'], latest['delta_text']
+
+        if self.version < 2:
+            # Send message to WebSocket; a BALL_UPDATE is the full state, so
+            # only the newest of the pending ones matters
+            self.seq = seq
+            await self.consumer.send(text_data=latest['text'])
+            return
+
+        if not resync and seq == self.seq + 1:
+            self.seq = seq
+            await self.consumer.send(text_data=delta_text)
+        else:
+            # Several balls coalesced, a missed ball, or the engine restarted
+            # (or the match was reset) and has nothing to diff against:
+            # resend everything
+            await self.send_snapshot(seq, latest['text'])
 
 class MatchConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -9,6 +201,11 @@ class MatchConsumer(AsyncWebsocketConsumer):
 
         self.match_id = self.scope['url_route']['kwargs']['match_id']
         self.room_group_name = f'match_{self.match_id}'
+        version, params = requested_version(self.scope)
+        self.stream = MatchStream(self, self.match_id, version)
+
+        # Counted before joining, so the engine builds the next ball for us
+        await add_viewer(self.match_id)
 
         # Join room group
         await self.channel_layer.group_add(
@@ -17,16 +214,106 @@ class MatchConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        await self.stream.start(parse_int(params.get('since', [None])[0]))
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'stream'):
+            self.stream.close()
         # Leave room group
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            await remove_viewer(self.match_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # v2 clients that detect a gap ask for {"action": "snapshot"}
+        if self.stream.version < 2 or not text_data:
+            return
+        try:
+            message = json.loads(text_data)
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get('action') == 'snapshot':
+            await self.stream.send_current_snapshot()
 
     # Receive message from room group
     async def match_update(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps(event['payload']))
+        await self.stream.update(event)
+
+class MultiMatchConsumer(AsyncWebsocketConsumer):
+    """
+    Several matches over one socket (`ws/matches/`). The client sends
+    {"action": "subscribe", "match_id": 1} (optionally with "since"),
+    {"action": "unsubscribe", "match_id": 1} and, for v2,
+    {"action": "snapshot", "match_id": 1}. Updates are the same messages a
+    single-match socket gets; each already carries its matchId.
+    """
+
+    async def connect(self):
+        if not self.scope['user'].is_authenticated:
+            await self.close()
+            return
+
+        self.version, _ = requested_version(self.scope)
+        # match_id -> MatchStream
+        self.streams = {}
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for match_id, stream in list(getattr(self, 'streams', {}).items()):
+            stream.close()
+            await self.channel_layer.group_discard(f'match_{match_id}', self.channel_name)
+            await remove_viewer(match_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        action = message.get('action')
+        match_id = parse_int(message.get('match_id'))
+        if match_id is None:
+            await self.send_error(action, None, "match_id is required")
+            return
+
+        if action == 'subscribe':
+            await self.subscribe(match_id, parse_int(message.get('since')))
+        elif action == 'unsubscribe':
+            await self.unsubscribe(match_id)
+        elif action == 'snapshot' and match_id in self.streams and self.version >= 2:
+            await self.streams[match_id].send_current_snapshot()
+
+    async def subscribe(self, match_id, since):
+        if match_id in self.streams:
+            return
+        if len(self.streams) >= MAX_SUBSCRIPTIONS:
+            await self.send_error('subscribe', match_id, f"At most {MAX_SUBSCRIPTIONS} matches per connection")
+            return
+        stream = MatchStream(self, match_id, self.version)
+        self.streams[match_id] = stream
+        await add_viewer(match_id)
+        await self.channel_layer.group_add(f'match_{match_id}', self.channel_name)
+        await self.send(text_data=dumps({'type': 'SUBSCRIBED', 'matchId': match_id}))
+        await stream.start(since)
+
+    async def unsubscribe(self, match_id):
+        stream = self.streams.pop(match_id, None)
+        if stream is None:
+            return
+        stream.close()
+        await self.channel_layer.group_discard(f'match_{match_id}', self.channel_name)
+        await remove_viewer(match_id)
+        await self.send(text_data=dumps({'type': 'UNSUBSCRIBED', 'matchId': match_id}))
+
+    async def send_error(self, action, match_id, text):
+        await self.send(text_data=dumps({'type': 'ERROR', 'action': action, 'matchId': match_id, 'message': text}))
+
+    # Receive message from any subscribed match group
+    async def match_update(self, event):
+        stream = self.streams.get(event['match_id'])
+        if stream is not None:
+            await stream.update(event)
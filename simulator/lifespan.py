@@ -0,0 +1,57 @@
+import asyncio
+from django.conf import settings
+
+
+class SimulationLifespan:
+    """
+    ASGI wrapper that runs the AsyncBallScheduler on the server's own event
+    loop when SIMULATION_SCHEDULER is 'asyncio'. Servers that implement the
+    lifespan protocol (uvicorn, hypercorn) start it on startup and cancel it
+    on shutdown. Daphne sends no lifespan events, so there it is started by
+    the first HTTP request or WebSocket connection instead.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.enabled = getattr(settings, 'SIMULATION_SCHEDULER', 'thread') == 'asyncio'
+        self.scheduler = None
+        self.task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if self.enabled and self.task is None:
+            self.start()
+        await self.application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.enabled:
+                    self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def start(self):
+        # Deferred import to avoid registry not ready issues
+        from simulator.apps import log_debug
+        from simulator.services.scheduler import AsyncBallScheduler
+
+        self.scheduler = AsyncBallScheduler(log=log_debug, log_ticks=True)
+        self.task = asyncio.ensure_future(self.scheduler.run())
+        log_debug("Asyncio Simulation Scheduler Started")
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from simulator.models import Match, Ball
+from simulator.services.replay import ReplayEngine
+
+# Columns that identify a ball; timestamps and primary keys naturally differ
+BALL_FIELDS = [
+    'innings', 'over_number', 'ball_number', 'striker_id', 'non_striker_id', 'bowler_id',
+    'runs_batter', 'extras', 'total_runs', 'is_wide', 'is_no_ball', 'is_wicket',
+    'dismissal_type', 'dismissed_player_id',
+]
+
+class Command(BaseCommand):
+    help = "Regenerates a match's ball-by-ball history from its seed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_id', type=int)
+        parser.add_argument('--verify', action='store_true', help='Compare the replay with the stored Ball rows')
+        parser.add_argument('--quiet', action='store_true', help='Do not print every ball')
+
+    def handle(self, *args, **options):
+        try:
+            match = Match.objects.get(id=options['match_id'])
+        except Match.DoesNotExist:
+            raise CommandError(f"Match {options['match_id']} not found")
+
+        stored = None
+        deliveries = None
+        if options['verify']:
+            stored = list(Ball.objects.filter(match=match).order_by('id').values_list(*BALL_FIELDS))
+            deliveries = len(stored)
+
+        balls = ReplayEngine().replay(match, deliveries)
+        replayed = [tuple(getattr(ball, field) for field in BALL_FIELDS) for ball in balls]
+
+        if not options['quiet']:
+            for ball in balls:
+                self.stdout.write(
+                    f"{ball.innings} {ball.over_number}.{ball.ball_number} "
+                    f"runs={ball.total_runs}{' WICKET' if ball.is_wicket else ''}{' WIDE' if ball.is_wide else ''}"
+                )
+
+        if stored is None:
+            self.stdout.write(self.style.SUCCESS(f"Replayed {len(balls)} balls for Match {match.id} (seed {match.seed})"))
+            return
+
+        for i, (expected, actual) in enumerate(zip(stored, replayed)):
+            if expected != actual:
+                raise CommandError(f"Ball {i + 1} differs: stored {expected}, replayed {actual}")
+        if len(stored) != len(replayed):
+            raise CommandError(f"Stored {len(stored)} balls but replayed {len(replayed)}")
+        self.stdout.write(self.style.SUCCESS(f"Replay matches all {len(stored)} stored balls for Match {match.id}"))
@@ -1,38 +1,25 @@
-import time
-from django.core.management.base import BaseCommand
-from simulator.models import Match
-from simulator.services.engine import SimulationEngine
+from django.core.management.base import BaseCommand, CommandError
+from simulator.services.leases import MatchLease
+from simulator.services.scheduler import BallScheduler
 
 class Command(BaseCommand):
     help = 'Runs the cricket simulation loop for live matches'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=1, help='Number of worker shards the matches are split across')
+        parser.add_argument('--shard', type=int, default=0, help='Shard this worker runs (0 to shards-1)')
+        parser.add_argument('--threads', type=int, default=None, help='Threads to simulate each tick on (default: SIMULATION_THREADS)')
+
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting Simulation Engine..."))
-        engine = SimulationEngine()
-        
-        # Track last update time per match_id
-        last_updates = {}
-        
-        while True:
-            live_matches = Match.objects.filter(is_live=True, match_ended=False)
-            
-            if not live_matches.exists():
-                # self.stdout.write("No live matches. Waiting...") # Too noisy
-                time.sleep(1)
-                continue
-            
-            now = time.time()
-            
-            for match in live_matches:
-                last_update = last_updates.get(match.id, 0)
-                
-                if now - last_update >= match.seconds_per_ball:
-                    # self.stdout.write(f"Simulating ball for Match {match.id}")
-                    try:
-                        engine.simulate_ball(match)
-                        last_updates[match.id] = now
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"Error in Match {match.id}: {e}"))
-            
-            # Tick rate
-            time.sleep(0.1)
+        shards, shard = options['shards'], options['shard']
+        if shards < 1 or not 0 <= shard < shards:
+            raise CommandError("--shard must be between 0 and --shards - 1")
+
+        lease = MatchLease(shard=shard, shards=shards)
+        self.stdout.write(self.style.SUCCESS(f"Starting Simulation Engine (shard {shard}/{shards}, worker {lease.owner})..."))
+        scheduler = BallScheduler(
+            log=lambda msg: self.stdout.write(self.style.ERROR(msg)),
+            lease=lease,
+            threads=options['threads'],
+        )
+        scheduler.run_forever()
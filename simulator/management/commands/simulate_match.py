@@ -0,0 +1,71 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from simulator.models import Match, Ball
+from simulator.services.engine import SimulationEngine
+from simulator.services.generator import create_dummy_match, setup_match_squads
+from simulator.services.leases import MatchLease
+from simulator.services.live_store import get_live_store
+
+class Command(BaseCommand):
+    help = 'Simulates matches to completion, either instantly in memory or ball by ball'
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_ids', nargs='*', type=int)
+        parser.add_argument('--instant', action='store_true', help='Fast-forward in memory and persist once per match')
+        parser.add_argument('--create', type=int, default=0, help='Create this many new dummy matches and simulate them too')
+
+    def handle(self, *args, **options):
+        matches = list(Match.objects.filter(id__in=options['match_ids']))
+        missing = set(options['match_ids']) - {match.id for match in matches}
+        if missing:
+            raise CommandError(f"Match(es) not found: {sorted(missing)}")
+
+        for _ in range(options['create']):
+            match = create_dummy_match()
+            setup_match_squads(match)
+            matches.append(match)
+
+        if not matches:
+            raise CommandError("Pass match ids and/or --create N")
+
+        engine = SimulationEngine()
+        # Hold each match's lease so no scheduler bowls it at the same time
+        lease = MatchLease()
+        start = time.time()
+        total_balls = 0
+        for match in matches:
+            if options['instant'] and match.is_live:
+                self.stderr.write(f"Match {match.id}: live, pause it before fast-forwarding")
+                continue
+            if match.id not in lease.claim([match.id]):
+                self.stderr.write(f"Match {match.id}: being simulated by another worker, skipped")
+                continue
+            try:
+                if options['instant']:
+                    balls = engine.simulate_match(match)
+                    # Nothing was recorded ball by ball; drop the stale stored state
+                    get_live_store().clear(match.id)
+                else:
+                    balls = self._simulate_live(engine, lease, match)
+            finally:
+                lease.release([match.id])
+            total_balls += balls
+            self.stdout.write(f"Match {match.id}: {balls} balls simulated")
+
+        elapsed = time.time() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Simulated {len(matches)} match(es), {total_balls} balls in {elapsed:.2f}s"
+        ))
+
+    def _simulate_live(self, engine, lease, match):
+        # Same path as the background loop: one ball per seconds_per_ball
+        before = Ball.objects.filter(match=match).count()
+        match.is_live = True
+        match.save(update_fields=['is_live'])
+        while match.is_live and not match.match_ended:
+            if match.id not in lease.claim([match.id]):
+                self.stderr.write(f"Match {match.id}: lease lost, stopping")
+                break
+            engine.simulate_ball(match)
+            time.sleep(match.seconds_per_ball)
+        return Ball.objects.filter(match=match).count() - before
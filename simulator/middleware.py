@@ -1,15 +1,16 @@
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
+from simulator.authentication import token_cache, lookup_token
+
+def user_for(value):
+    if value is None or not value[0].is_active:
+        return AnonymousUser()
+    return value[0]
 
 @database_sync_to_async
 def get_user(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
-        return AnonymousUser()
+    return user_for(lookup_token(token_key))
 
 class TokenAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
@@ -22,7 +23,9 @@ class TokenAuthMiddleware(BaseMiddleware):
             token_key = None
 
         if token_key:
-            scope['user'] = await get_user(token_key)
+            # Cached tokens are resolved without a trip to the database thread
+            hit, value = token_cache.get(token_key)
+            scope['user'] = user_for(value) if hit else await get_user(token_key)
         else:
             scope['user'] = AnonymousUser()
 
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:31
+
+import random
+
+import simulator.models
+from django.db import migrations, models
+
+
+def backfill_seeds(apps, schema_editor):
+    # AddField evaluates the default once; give every existing match its own seed
+    Match = apps.get_model('simulator', 'Match')
+    for match in Match.objects.all():
+        match.seed = random.getrandbits(63)
+        match.save(update_fields=['seed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0007_backfill_tournament'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='seed',
+            field=models.BigIntegerField(default=simulator.models.generate_match_seed),
+        ),
+        migrations.RunPython(backfill_seeds, migrations.RunPython.noop),
+    ]
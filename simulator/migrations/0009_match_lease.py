@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0008_match_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='lease_owner',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_lease_expires(apps, schema_editor):
+    # Never-leased matches count as expired from now on, so a worker of
+    # another shard can still take them over after a lease period
+    Match = apps.get_model('simulator', 'Match')
+    Match.objects.filter(lease_expires__isnull=True).update(lease_expires=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0009_match_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lease_expires, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='match',
+            name='lease_expires',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,4 +1,10 @@
+import random
 from django.db import models
+from django.utils import timezone
+
+
+def generate_match_seed():
+    return random.getrandbits(63)
 
 class Nationality(models.Model):
     name = models.CharField(max_length=100)
@@ -101,6 +107,14 @@ class Match(models.Model):
     toss_won_by = models.ForeignKey(Team, on_delete=models.SET_NULL, null=True, blank=True, related_name='toss_wins')
     opt_to = models.CharField(max_length=10, choices=TOSS_DECISION_CHOICES, null=True, blank=True)
     current_innings = models.IntegerField(default=1)
+
+    # Seeds the engine's random stream so a match can be replayed exactly
+    seed = models.BigIntegerField(default=generate_match_seed)
+
+    # The simulation worker currently running this match, and until when;
+    # see services/leases.py
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires = models.DateTimeField(default=timezone.now)
     
     def __str__(self):
         return f"Match {self.id} | {self.match_type} | {self.date}"
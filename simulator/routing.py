@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/matches/(?P<match_id>\d+)/$', consumers.MatchConsumer.as_asgi()),
+    re_path(r'ws/matches/$', consumers.MultiMatchConsumer.as_asgi()),
 ]
@@ -1,5 +1,6 @@
+from django.db.models import OuterRef, Prefetch, Subquery
 from rest_framework import serializers
-from .models import Match, Team, Player, PlayingSquad, Nationality, Tournament
+from .models import Match, Team, Player, PlayingSquad, Nationality, Tournament, InningsScore
 
 class NationalitySerializer(serializers.ModelSerializer):
     class Meta:
@@ -48,11 +49,20 @@ class TeamSquadSerializer(serializers.ModelSerializer):
         # We need the match context to filter the squad correctly
         match = self.context.get('match')
         if match:
-            squad_entries = PlayingSquad.objects.filter(team=team_obj, match=match)
+            if hasattr(match, 'prefetched_squads'):
+                # Loaded for every match at once by MatchSerializer.setup_eager_loading
+                squad_entries = [entry for entry in match.prefetched_squads if entry.team_id == team_obj.id]
+            else:
+                squad_entries = PlayingSquad.objects.filter(team=team_obj, match=match).select_related('player__nationality')
             return SquadPlayerSerializer(squad_entries, many=True).data
         return []
 
 class MatchSerializer(serializers.ModelSerializer):
+    """
+    Takes an optional `fields` list to return only those fields. Squads are
+    only included when the context's `expand` contains 'squads'; otherwise
+    teams are listed without them.
+    """
     # We use a serializer method field or custom init to pass context to TeamSerializer if we want nested squad
     teams = serializers.SerializerMethodField()
     tournament = TournamentSerializer(read_only=True)
@@ -71,19 +81,65 @@ class MatchSerializer(serializers.ModelSerializer):
             'toss_won_by', 'opt_to', 'current_innings', 'score'
         ]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            # Unknown names are ignored
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=()):
+        """
+        Load what the serializer will read, with a fixed number of queries
+        however many matches are listed: the matches themselves (with the
+        current innings' score as subqueries), their teams and, if expanded,
+        the squads with players. Relations behind fields that were not
+        requested are not loaded at all.
+        """
+        queryset = queryset.select_related('tournament', 'toss_won_by')
+        if fields is None or 'score' in fields:
+            score = InningsScore.objects.filter(
+                match=OuterRef('pk'), innings=OuterRef('current_innings'),
+            ).order_by('id')
+            queryset = queryset.annotate(**{
+                f'score_{column}': Subquery(score.values(column)[:1])
+                for column in ('total_runs', 'total_wickets', 'total_overs', 'team_id')
+            })
+        if fields is None or 'teams' in fields:
+            queryset = queryset.prefetch_related('teams')
+            if 'squads' in expand:
+                queryset = queryset.prefetch_related(Prefetch(
+                    'squads',
+                    queryset=PlayingSquad.objects.select_related('player__nationality').order_by('id'),
+                    to_attr='prefetched_squads',
+                ))
+        return queryset
+
     def get_teams(self, obj):
+        if 'squads' not in self.context.get('expand', ()):
+            return TeamSerializer(obj.teams.all(), many=True).data
         # Pass the match object in context so TeamSquadSerializer can find the specific squad
         return TeamSquadSerializer(obj.teams.all(), many=True, context={'match': obj}).data
 
     def get_score(self, obj):
-        from .models import InningsScore
+        if hasattr(obj, 'score_team_id'):
+            # Annotated by setup_eager_loading
+            if obj.score_team_id is None:
+                return {}
+            return {
+                'runs': obj.score_total_runs,
+                'wickets': obj.score_total_wickets,
+                'overs': obj.score_total_overs,
+                'team_id': obj.score_team_id
+            }
         score = InningsScore.objects.filter(match=obj, innings=obj.current_innings).first()
         if score:
             return {
                 'runs': score.total_runs,
                 'wickets': score.total_wickets,
                 'overs': score.total_overs,
-                'team_id': score.team.id
+                'team_id': score.team_id
             }
         return {}
 
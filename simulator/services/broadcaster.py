@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from collections import deque
+from django.conf import settings
+from channels.layers import get_channel_layer
+
+
+async def send_updates(channel_layer, updates):
+    """
+    Send the group messages built by SimulationEngine.simulate_tick. Matches
+    are sent concurrently, but each match's balls one after another, so
+    clients get them in the order they were bowled.
+    """
+    by_match = {}
+    for update in updates:
+        by_match.setdefault(update['match_id'], []).append(update)
+    await asyncio.gather(*(
+        _send_in_order(channel_layer, f"match_{match_id}", messages)
+        for match_id, messages in by_match.items()
+    ))
+
+
+async def _send_in_order(channel_layer, group, messages):
+    for message in messages:
+        await channel_layer.group_send(group, message)
+
+
+class Broadcaster:
+    """
+    Outbox for the group messages of bowled balls. The simulation only
+    appends to a bounded queue, after its transaction has committed, and
+    carries on; a daemon thread drains the queue in batches and sends each
+    batch (see send_updates) on one long-lived event loop, so the
+    channel layer keeps its connections instead of reconnecting per call.
+
+    If the channel layer falls behind and the queue fills up, the oldest
+    messages are dropped. Every ball is already in the live store, and a
+    client that misses a delta gets the next ball as a snapshot.
+    """
+
+    def __init__(self, max_size=None, batch_size=None, log=print):
+        if max_size is None:
+            max_size = getattr(settings, 'BROADCAST_QUEUE_SIZE', 10000)
+        if batch_size is None:
+            batch_size = getattr(settings, 'BROADCAST_BATCH_SIZE', 500)
+        self.queue = deque(maxlen=max_size)
+        self.batch_size = batch_size
+        self.log = log
+        self.dropped = 0
+        self.ready = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="Broadcaster", daemon=True)
+        self.thread.start()
+
+    def put(self, updates):
+        with self.ready:
+            for update in updates:
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append(update)
+            self.ready.notify()
+
+    def take(self, timeout=None):
+        """Up to batch_size queued messages, oldest first, waiting up to `timeout` for one."""
+        with self.ready:
+            if not self.queue:
+                self.ready.wait(timeout)
+            batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.batch_size))]
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            self.log(f"Broadcast queue full: dropped {dropped} messages")
+        return batch
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        channel_layer = get_channel_layer()
+        while True:
+            batch = self.take()
+            if not batch:
+                continue
+            try:
+                loop.run_until_complete(send_updates(channel_layer, batch))
+            except Exception as e:
+                self.log(f"Broadcast error: {e}")
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = Broadcaster()
+            _broadcaster.start()
+        return _broadcaster
@@ -0,0 +1,38 @@
+"""
+Diffs between consecutive BALL_UPDATE payloads for the v2 WebSocket protocol.
+
+A delta lists only what changed. Objects are compared key by key and merged
+recursively on the client; any other value (numbers, strings, null, lists)
+replaces the previous one wholesale. A key that disappears is sent as null.
+"""
+
+
+def diff(old, new):
+    """Changes that turn `old` into `new`; an empty dict if they are equal."""
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+        previous = old[key]
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def apply(document, changes):
+    """Merge `changes` into `document` in place, as a client would. Returns `document`."""
+    for key, value in changes.items():
+        current = document.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            apply(current, value)
+        else:
+            document[key] = value
+    return document
@@ -0,0 +1,21 @@
+import json
+
+try:
+    import ujson
+except ImportError: # Optional; the standard library encoder gives the same JSON
+    ujson = None
+
+
+def dumps(obj):
+    """Encode a WebSocket message as compact JSON text."""
+    if ujson is not None:
+        return ujson.dumps(obj, escape_forward_slashes=False)
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def snapshot_text(match_id, seq, payload_text, version=2):
+    """A v2 SNAPSHOT envelope around an already encoded payload."""
+    return (
+        f'{{"type":"SNAPSHOT","version":{version},"matchId":{int(match_id)},"seq":{seq},'
+        f'"payload":{payload_text}}}'
+    )
@@ -1,15 +1,43 @@
-import random
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.db import transaction, models
-from django.utils import timezone
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from simulator.models import Match, Team, Player, Ball, InningsScore, BattingScore, BowlingScore, PlayingSquad
+from django.db import transaction
+from functools import partial
+from simulator.models import Ball, BattingScore, BowlingScore
+from simulator.services.roster import MatchRoster
+from simulator.services.state import MatchState, flush_states
+from simulator.services.outcomes import sample_outcome
+from simulator.services.projections import project
+from simulator.services.delta import diff
+from simulator.services.encoding import dumps
+from simulator.services.live_store import get_live_store
+from simulator.services.broadcaster import get_broadcaster
+
 
 class SimulationEngine:
-    def __init__(self):
-        pass
+    def __init__(self, broadcaster=None):
+        # Where ball messages are queued; the process-wide one by default
+        self.broadcaster = broadcaster
+        # match_id -> MatchState, loaded on the first ball and advanced in memory
+        self.states = {}
+        # match_id -> MatchRoster; teams and squads do not change while a match is live
+        self.rosters = {}
+
+    def get_roster(self, match):
+        roster = self.rosters.get(match.id)
+        if roster is None:
+            roster = MatchRoster(match)
+            self.rosters[match.id] = roster
+        return roster
+
+    def get_state(self, match):
+        state = self.states.get(match.id)
+        if state is None or state.current_innings != match.current_innings:
+            state = MatchState.load(match, self.get_roster(match))
+            self.states[match.id] = state
+        return state
+
+    def evict(self, match_id):
+        """Drop cached state, e.g. when a match is paused, reset or finished."""
+        self.states.pop(match_id, None)
+        self.rosters.pop(match_id, None)
 
     def simulate_ball(self, match):
         """
@@ -19,377 +47,485 @@ class SimulationEngine:
             return
 
         with transaction.atomic():
-            # Reload match to lock it or ensure fresh data? 
-            # For now, just trust the object passed or re-fetch if needed.
-            # match.refresh_from_db() 
-            
-            innings_score, created = InningsScore.objects.get_or_create(
-                match=match, 
-                team=self._get_batting_team(match),
-                innings=match.current_innings
-            )
-
-            # Check if innings over
-            if innings_score.is_completed:
-                self._handle_innings_break(match, innings_score)
-                return
-
-            # Calculate current over/ball before outcome
-            legal_balls = Ball.objects.filter(match=match, innings=match.current_innings, is_wide=False, is_no_ball=False).count()
-            over_number = legal_balls // 6
-            ball_number = (legal_balls % 6) + 1
-
-            # Determine Outcome
-            outcome = self._determine_outcome(match, innings_score, over_number, ball_number)
-
-            # Get Context (Striker, Bowler, etc.)
-            striker, non_striker = self._get_current_batters(match, innings_score)
-            bowler = self._get_current_bowler(match, innings_score)
-
-            if not striker or not bowler:
-                print(f"Match {match.id}: Not enough players to continue.")
-                # Maybe stop simulation?
-                match.is_live = False
-                match.save()
-                return
-
-            # Calculate Runs/Extras
-            runs_batter = outcome['runs']
-            extras = outcome['extras']
-            total_runs = runs_batter + extras
-            is_wicket = outcome['is_wicket']
-            
-            # Create Ball
-            ball = Ball.objects.create(
-                match=match,
-                innings=match.current_innings,
-                over_number=over_number,
-                ball_number=ball_number,
-                striker=striker,
-                non_striker=non_striker,
-                bowler=bowler,
-                runs_batter=runs_batter,
-                extras=extras,
-                total_runs=total_runs,
-                is_wide=outcome['is_wide'],
-                is_no_ball=outcome['is_no_ball'],
-                is_wicket=is_wicket,
-                dismissal_type=outcome['dismissal_type'] if is_wicket else None,
-                dismissed_player=striker if is_wicket else None # Simple: striker always out
-            )
-
-            # Update Scores
-            self._update_innings_score(innings_score, total_runs, is_wicket, outcome)
-            self._update_batting_score(match, striker, runs_batter, is_wicket)
-            self._update_bowling_score(match, bowler, total_runs, is_wicket, outcome)
-            
-            # Handle Wicket (Swap striker/new bat) - Implicitly handled by _get_current_batters next time?
-            # No, we need to mark the batter as out in BattingScore so _get_current_batters picks a NEW one.
-            
-            # Handle Over End (Swap Ends?) - Logic for finding striker needs to know who is on strike.
-            # Complex. For MVP:
-            # - We need to track who is on strike. 
-            # - Simpler: Just randomise who faces next if it's an odd run? 
-            # - Better: Store 'on_strike_player' in a cache or deduce it.
-            # - Let's deduce:
-            #   If runs are odd -> Swap.
-            #   If over ends -> Swap.
-            #   We need to persist this state. 
-            #   Phase 4 MVP: Randomly pick one of the two active batters to be striker? 
-            #   No, that's too chaotic.
-            #   Let's rely on LAST ball.
-            
-            self._handle_strike_rotation(match, ball, striker, non_striker)
-
-            # Check for Innings/Match End conditions
-            if innings_score.total_wickets >= 10:
-                innings_score.is_completed = True
-                innings_score.save()
-                self._handle_innings_break(match, innings_score)
+            try:
+                delivery = self._advance(match)
+                flush_states([self.states[match.id]])
+            except Exception:
+                # State may be ahead of the database now; reload it next time
+                self.evict(match.id)
+                raise
+
+        # Built and sent outside the transaction, so the write lock is not
+        # held while the ball is encoded and handed to the channel layer
+        self._release_if_finished(match)
+        if delivery:
+            viewers = get_live_store().viewer_counts([match.id])
+            self.send_updates([self._build_update(match, delivery, viewers[match.id])])
+
+    def simulate_tick(self, matches, send=True, lease=None):
+        """
+        Simulate one ball for each of `matches` and write all of them with
+        bulk inserts/updates in a single transaction.
+        Returns the group messages for the balls bowled; with send=False they
+        are not sent, so a caller on an event loop can send them itself.
+        With a MatchLease, balls of matches it no longer holds are discarded.
+        """
+        advanced = []
+        for match in matches:
+            if match.match_ended or not match.is_live:
+                continue
+            try:
+                advanced.append((match, self._advance(match)))
+            except Exception as e:
+                print(f"Match {match.id}: Simulation error: {e}")
+                self.evict(match.id)
+
+        if not advanced:
+            return []
+
+        try:
+            with transaction.atomic():
+                if lease is not None:
+                    advanced = self._fence(lease, advanced)
+                flush_states([self.states[match.id] for match, _ in advanced])
+        except Exception:
+            for match, _ in advanced:
+                self.evict(match.id)
+            raise
+
+        # One lookup for the whole tick; the store is Redis when servers are separate
+        viewers = get_live_store().viewer_counts([match.id for match, _ in advanced])
+        updates = []
+        for match, delivery in advanced:
+            self._release_if_finished(match)
+            if delivery:
+                updates.append(self._build_update(match, delivery, viewers[match.id]))
+        updates = [update for update in updates if update is not None]
+        if send:
+            self.send_updates(updates)
+        return updates
+
+    def _fence(self, lease, advanced):
+        held = lease.fence([match.id for match, _ in advanced])
+        for match, _ in advanced:
+            if match.id not in held:
+                print(f"Match {match.id}: Lease lost, ball discarded")
+                self.evict(match.id)
+        return [(match, delivery) for match, delivery in advanced if match.id in held]
+
+    def simulate_match(self, match):
+        """
+        Fast-forward a match to completion without broadcasting: every ball is
+        bowled against the in-memory state and all rows are written in one
+        bulk flush at the end. Returns the number of balls bowled.
+        """
+        if match.match_ended:
+            return 0
 
-            # Ensure new batter is created after wicket for payload completeness
-            self._get_current_batters(match, innings_score)
-
-            # Broadcast Event
-            channel_layer = get_channel_layer()
-            extra_type = None
-            if ball.is_wide:
-                extra_type = "WIDE"
-            elif ball.is_no_ball:
-                extra_type = "NO_BALL"
-            elif ball.is_bye:
-                extra_type = "BYE"
-            elif ball.is_leg_bye:
-                extra_type = "LEG_BYE"
-
-            legal_balls_after = Ball.objects.filter(match=match, innings=match.current_innings, is_wide=False, is_no_ball=False).count()
-            overs_float = legal_balls_after / 6 if legal_balls_after > 0 else 0
-            run_rate = (innings_score.total_runs / overs_float) if overs_float > 0 else 0
-
-            payload = self._build_ws_payload(
-                match=match,
-                innings_score=innings_score,
-                ball=ball,
-                striker=striker,
-                non_striker=non_striker,
-                bowler=bowler,
-                extra_type=extra_type,
-                run_rate=run_rate,
-            )
-            async_to_sync(channel_layer.group_send)(
-                f'match_{match.id}',
-                {
-                    'type': 'match_update',
-                    'payload': payload
-                }
-            )
+        bowled = 0
+        with transaction.atomic():
+            try:
+                while not match.match_ended:
+                    innings = match.current_innings
+                    if self._advance(match):
+                        bowled += 1
+                    elif match.current_innings == innings and not match.match_ended:
+                        break # Could not bowl (e.g. not enough players)
+                flush_states([self.states[match.id]])
+            finally:
+                self.evict(match.id)
+        return bowled
+
+    def _release_if_finished(self, match):
+        if match.match_ended or not match.is_live:
+            self.evict(match.id)
 
-    def _determine_outcome(self, match, innings_score, over_number, ball_number):
-        # Weighted Random
-        choices = [
-            {'runs': 0, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False}, # Dot
-            {'runs': 1, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False}, # Single
-            {'runs': 2, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False}, # Double
-            {'runs': 4, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False}, # Four
-            {'runs': 6, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False}, # Six
-            {'runs': 0, 'extras': 0, 'is_wicket': True,  'is_wide': False, 'is_no_ball': False, 'dismissal_type': 'CAUGHT'}, # Wicket
-            {'runs': 0, 'extras': 1, 'is_wicket': False, 'is_wide': True,  'is_no_ball': False}, # Wide
-        ]
-        weights = [40, 30, 5, 8, 4, 3, 2] # Probabilities
-
-        # Encourage wickets between overs 3-5 (inclusive)
-        if 3 <= over_number <= 5:
-            weights = [38, 29, 5, 8, 4, 8, 2]
-        return random.choices(choices, weights=weights, k=1)[0]
-
-    def _get_batting_team(self, match):
-        # T20: Innings 1 -> Toss Winner (if Bat) or Loser (if Bowl)
-        # Simplified: Just grab teams[0] for inn 1, teams[1] for inn 2
-        teams = list(match.teams.all())
-        if match.current_innings == 1:
-            return teams[0]
+    def _advance(self, match):
+        """
+        Bowl one ball against the in-memory state and queue the rows it
+        changes. Returns the delivery to broadcast, or None if no ball was
+        bowled (innings break, not enough players).
+        """
+        state = self.get_state(match)
+        innings = state.innings
+        innings_score = innings.innings_score
+
+        # Check if innings over
+        if innings_score.is_completed:
+            self._handle_innings_break(match, state)
+            return None
+
+        # Calculate current over/ball before outcome
+        over_number = innings.legal_balls // 6
+        ball_number = (innings.legal_balls % 6) + 1
+
+        # Determine Outcome; every random draw for this ball comes from the
+        # match's own stream, in a fixed order (outcome, then bowler)
+        state.begin_delivery()
+        outcome = self._determine_outcome(match, innings_score, over_number, ball_number)
+
+        # Get Context (Striker, Bowler, etc.)
+        striker, non_striker = self._get_current_batters(match, state)
+        bowler = self._get_current_bowler(match, state)
+
+        if not striker or not bowler:
+            print(f"Match {match.id}: Not enough players to continue.")
+            # Maybe stop simulation?
+            match.is_live = False
+            state.mark_dirty(match)
+            return None
+
+        # Calculate Runs/Extras
+        runs_batter = outcome['runs']
+        extras = outcome['extras']
+        total_runs = runs_batter + extras
+        is_wicket = outcome['is_wicket']
+
+        # Create Ball (written by flush_states). FKs are set by id; the player
+        # objects themselves live in state.players.
+        ball = Ball(
+            match_id=match.id,
+            innings=innings.innings,
+            over_number=over_number,
+            ball_number=ball_number,
+            striker_id=striker.id,
+            non_striker_id=non_striker.id,
+            bowler_id=bowler.id,
+            runs_batter=runs_batter,
+            extras=extras,
+            total_runs=total_runs,
+            is_wide=outcome['is_wide'],
+            is_no_ball=outcome['is_no_ball'],
+            is_wicket=is_wicket,
+            dismissal_type=outcome['dismissal_type'] if is_wicket else None,
+            dismissed_player_id=striker.id if is_wicket else None # Simple: striker always out
+        )
+        state.pending_balls.append(ball)
+        state.seq += 1
+        innings.deliveries += 1
+        if not (ball.is_wide or ball.is_no_ball):
+            innings.legal_balls += 1
+            innings.bowler_legal_balls[bowler.id] = innings.bowler_legal_balls.get(bowler.id, 0) + 1
+
+        # Update Scores
+        self._update_innings_score(state, total_runs, is_wicket, outcome)
+        self._update_batting_score(match, state, striker, runs_batter, is_wicket)
+        self._update_bowling_score(match, state, bowler, total_runs, is_wicket, outcome)
+        self._update_partnership(state, ball)
+        self._update_ball_history(state, ball)
+
+        # Work out who faces the next ball; a dismissed striker is replaced
+        # by the incoming batter, who always takes strike.
+        self._handle_strike_rotation(state, ball)
+
+        # Check for Innings/Match End conditions
+        if innings_score.total_wickets >= 10:
+            innings_score.is_completed = True
+            self._handle_innings_break(match, state)
         else:
-            return teams[1]
+            # Ensure new batter is created after wicket for payload completeness
+            self._get_current_batters(match, state)
 
-    def _get_bowling_team(self, match):
-        teams = list(match.teams.all())
-        if match.current_innings == 1:
-            return teams[1]
-        else:
-            return teams[0]
-
-    def _get_current_batters(self, match, innings_score):
-        # Find 2 batters who are NOT out and have BattingScores or need new ones.
-        # Get existing scores
-        scores = BattingScore.objects.filter(match=match, innings=match.current_innings)
-        active_scores = scores.filter(is_out=False)
-        
-        active_batters = [s.player for s in active_scores]
-        
-        # If less than 2, pick new ones
-        needed = 2 - len(active_batters)
-        if needed > 0:
-            team = innings_score.team
-            squad = PlayingSquad.objects.filter(match=match, team=team).select_related('player')
-            existing_ids = [s.player.id for s in scores]
-            candidates = [sq.player for sq in squad if sq.player.id not in existing_ids] # Order by squad id implicitly or random?
-            
-            # Simple Sort: Captain/WK or just ID
-            new_batters = candidates[:needed]
-            
-            for player in new_batters:
-                # If this is the FIRST/Opening pair, set first one as strike?
-                is_strike = (len(active_batters) == 0) and (active_scores.count() == 0) # Very first batter
-                # Or if we just got out, and we need a replacement, does he take strike?
-                # Check logic in _handle_strike_rotation: w/ Wicket Striker, we clear flags.
-                # So if no one is on strike, the NEW guy takes strike?
-                # If we have 1 active (NonStriker) who is NOT on strike, new guy MUST be on strike.
-                
-                check_strike = False
-                if not active_scores.filter(is_on_strike=True).exists():
-                     # No one currently on strike.
-                     # If there is another batter, is he off strike?
-                     other = active_scores.first()
-                     if other and not other.is_on_strike:
-                         check_strike = True
-                     elif not other:
-                         # Opening pair: First guy strike
-                         if len(active_batters) == 0: 
-                             check_strike = True
-                             
-                s = BattingScore.objects.create(match=match, player=player, innings=match.current_innings, is_on_strike=check_strike)
-                active_batters.append(player)
-        
-        if len(active_batters) < 2:
+        return {
+            'state': state,
+            'seq': state.seq,
+            'innings': innings,
+            'ball': ball,
+            'striker': striker,
+            'non_striker': non_striker,
+            'bowler': bowler,
+        }
+
+    def _build_update(self, match, delivery, viewers):
+        """The group message for a bowled ball, or None if nobody is watching."""
+        state = delivery['state']
+        if not viewers:
+            # Nobody is watching: build nothing. The stored state is now out
+            # of date, so drop it; a new viewer's snapshot is rebuilt from the
+            # database and the next ball after that is sent in full.
+            if state.last_payload is not None:
+                state.last_payload = None
+                get_live_store().clear(match.id)
+            return None
+
+        # Every message carries the full payload (for v1 clients and for v2
+        # clients that need a snapshot) and the v2 delta message, which is
+        # None when there is nothing to diff against. Both are encoded here,
+        # once per ball; consumers only write the text to their sockets.
+        payload = self._build_delivery_payload(match, delivery)
+        delta_text = None
+        if state.last_payload is not None:
+            delta = diff(state.last_payload, payload)
+            delta.pop('seq', None)
+            delta_text = dumps({
+                'type': 'BALL_DELTA',
+                'version': 2,
+                'matchId': match.id,
+                'seq': delivery['seq'],
+                'changes': delta,
+            })
+        state.last_payload = payload
+        text = dumps(payload)
+
+        # Stored before sending, so a client that connects in between gets
+        # this ball in its snapshot (or backfill) and skips the group message
+        get_live_store().record_ball(match.id, delivery['seq'], text, delta_text)
+
+        return {
+            'type': 'match_update',
+            'match_id': match.id,
+            'seq': delivery['seq'],
+            'text': text,
+            'delta_text': delta_text,
+        }
+
+    def send_updates(self, updates):
+        """
+        Queue group messages on the broadcaster (services/broadcaster.py).
+        Nothing is queued before the surrounding transaction, if any, has
+        committed, so a ball that is rolled back is never announced.
+        """
+        updates = [update for update in updates if update is not None]
+        if updates:
+            broadcaster = self.broadcaster or get_broadcaster()
+            transaction.on_commit(partial(broadcaster.put, updates))
+
+    def build_snapshot(self, match):
+        """
+        Rebuild the BALL_UPDATE payload of a match's latest ball from the
+        database, for clients that have just connected or lost their place.
+        Returns (seq, payload); payload is None before the first ball.
+        """
+        seq = Ball.objects.filter(match=match).count()
+        ball = Ball.objects.filter(match=match).order_by('-id').first()
+        if ball is None:
+            return 0, None
+
+        state = MatchState(match, MatchRoster(match))
+        state.seq = seq
+        state.innings = state._load_innings(match, ball.innings)
+        delivery = {
+            'state': state,
+            'seq': seq,
+            'innings': state.innings,
+            'ball': ball,
+            'striker': state.players[ball.striker_id],
+            'non_striker': state.players[ball.non_striker_id],
+            'bowler': state.players[ball.bowler_id],
+        }
+        return seq, self._build_delivery_payload(match, delivery)
+
+    def _build_delivery_payload(self, match, delivery):
+        innings = delivery['innings']
+        innings_score = innings.innings_score
+        ball = delivery['ball']
+
+        extra_type = None
+        if ball.is_wide:
+            extra_type = "WIDE"
+        elif ball.is_no_ball:
+            extra_type = "NO_BALL"
+        elif ball.is_bye:
+            extra_type = "BYE"
+        elif ball.is_leg_bye:
+            extra_type = "LEG_BYE"
+
+        overs_float = innings.legal_balls / 6 if innings.legal_balls > 0 else 0
+        run_rate = (innings_score.total_runs / overs_float) if overs_float > 0 else 0
+
+        return self._build_ws_payload(
+            match=match,
+            state=delivery['state'],
+            innings=innings,
+            ball=ball,
+            striker=delivery['striker'],
+            non_striker=delivery['non_striker'],
+            bowler=delivery['bowler'],
+            extra_type=extra_type,
+            run_rate=run_rate,
+        )
+
+    def _determine_outcome(self, match, innings_score, over_number, ball_number):
+        # Weighted random from precompiled alias tables (see services/outcomes.py);
+        # wickets are encouraged between overs 3-5 (inclusive)
+        return sample_outcome(over_number, self.states[match.id].rng)
+
+    def _get_current_batters(self, match, state):
+        # Fill any empty crease position from the batting order. The opening
+        # pair is (first, second); a replacement for a dismissed striker takes strike.
+        innings = state.innings
+        if innings.striker_id is None or innings.non_striker_id is None:
+            candidates = [
+                p for p in state.roster.batting_order(innings.team.id)
+                if p.id not in innings.batting_scores
+            ]
+            for player in candidates:
+                if innings.striker_id is None:
+                    innings.striker_id = player.id
+                elif innings.non_striker_id is None:
+                    innings.non_striker_id = player.id
+                else:
+                    break
+                score = BattingScore(
+                    match=match,
+                    player=player,
+                    innings=innings.innings,
+                    is_on_strike=(innings.striker_id == player.id),
+                )
+                innings.batting_scores[player.id] = score
+                state.mark_dirty(score)
+
+        if innings.striker_id is None or innings.non_striker_id is None:
             return None, None
-            
-        # Determine Striker vs Non-Striker
-        # We need the objects again to check flags
-        p1 = active_batters[0]
-        p2 = active_batters[1]
-        
-        s1 = BattingScore.objects.get(match=match, player=p1, innings=match.current_innings)
-        s2 = BattingScore.objects.get(match=match, player=p2, innings=match.current_innings)
-        
-        if s1.is_on_strike:
-            return p1, p2
-        elif s2.is_on_strike:
-            return p2, p1
-        else:
-            # Fallback: Default p1 strike
-            s1.is_on_strike = True
-            s1.save()
-            return p1, p2
-
-    def _get_current_bowler(self, match, innings_score):
-        # Bowling team
-        team = self._get_bowling_team(match)
-        squad = PlayingSquad.objects.filter(match=match, team=team).select_related('player')
-        
+        return state.players[innings.striker_id], state.players[innings.non_striker_id]
+
+    def _get_current_bowler(self, match, state):
         # Logic: Pick a bowler. Simplified: Random from BOWLERS/ALL_ROUNDERS
-        bowlers = [sq.player for sq in squad if sq.player.role in ['BOWLER', 'ALL_ROUNDER']]
+        team = state.bowling_team(state.innings.innings)
+        bowlers = state.roster.bowling_options.get(team.id)
         if not bowlers:
-             bowlers = [sq.player for sq in squad] # fallback
-        
-        return random.choice(bowlers)
+            return None
+        return state.rng.choice(bowlers)
 
-    def _update_innings_score(self, score, runs, is_wicket, outcome):
+    def _update_innings_score(self, state, runs, is_wicket, outcome):
+        innings = state.innings
+        score = innings.innings_score
         score.total_runs += runs
         score.extra_runs += outcome['extras']
         if is_wicket:
             score.total_wickets += 1
-        
-        # Overs update logic: 
-        # Float is tricky (0.5 + 0.1 = 0.6 -> 1.0). 
-        # Re-calc from DB is safer.
-        legal_balls = Ball.objects.filter(match=score.match, innings=score.innings, is_wide=False, is_no_ball=False).count()
-        overs = legal_balls // 6
-        balls = legal_balls % 6
+
+        overs = innings.legal_balls // 6
+        balls = innings.legal_balls % 6
         score.total_overs = float(f"{overs}.{balls}")
-        score.save()
+        state.mark_dirty(score)
 
-    def _update_batting_score(self, match, player, runs, is_out):
-        score, _ = BattingScore.objects.get_or_create(match=match, player=player, innings=match.current_innings)
+    def _update_batting_score(self, match, state, player, runs, is_out):
+        score = state.innings.batting_scores[player.id]
         score.runs += runs
         score.balls_faced += 1
         if runs == 4:
             score.fours += 1
         elif runs == 6:
             score.sixes += 1
-        
+
         if is_out:
             score.is_out = True
             score.dismissal_text = "Caught" # Stub
-        
+
         if score.balls_faced > 0:
             score.strike_rate = (score.runs / score.balls_faced) * 100
-        score.save()
-
-    def _update_bowling_score(self, match, player, runs_conceded, is_wicket, outcome):
-        score, _ = BowlingScore.objects.get_or_create(match=match, player=player, innings=match.current_innings)
+        state.mark_dirty(score)
+
+    def _update_bowling_score(self, match, state, player, runs_conceded, is_wicket, outcome):
+        innings = state.innings
+        score = innings.bowling_scores.get(player.id)
+        if score is None:
+            score = BowlingScore(match=match, player=player, innings=innings.innings)
+            innings.bowling_scores[player.id] = score
         score.runs_conceded += runs_conceded
         if is_wicket:
             score.wickets += 1
-        
+
         # Update overs bowled by THIS bowler
-        legal_balls = Ball.objects.filter(match=match, innings=match.current_innings, bowler=player, is_wide=False, is_no_ball=False).count()
+        legal_balls = innings.bowler_legal_balls.get(player.id, 0)
         overs = legal_balls // 6
         balls = legal_balls % 6
         score.overs = float(f"{overs}.{balls}")
-        
+
         if score.overs > 0:
              # Economy = Runs / Overs (Roughly)
              # Exact: Runs / (LegalBalls/6)
              total_overs = legal_balls / 6
              score.economy = score.runs_conceded / total_overs if total_overs > 0 else 0
-        
-        score.save()
 
-    def _handle_strike_rotation(self, match, ball, striker, non_striker):
-        # Determine who should be on strike next
+        state.mark_dirty(score)
+
+    def _update_ball_history(self, state, ball):
+        innings = state.innings
+        innings.record_extras(ball.is_wide, ball.is_no_ball, ball.is_bye, ball.is_leg_bye)
+        innings.last_balls.append({
+            'over': float(f"{ball.over_number}.{ball.ball_number}"),
+            'runs': ball.total_runs,
+        })
+
+    def _update_partnership(self, state, ball):
+        innings = state.innings
+        if ball.is_wicket:
+            innings.partnership_runs = 0
+            innings.partnership_balls = 0
+            player_id = ball.dismissed_player_id
+            innings.fall_of_wickets.append({
+                'score': innings.innings_score.total_runs,
+                'wicket': len(innings.fall_of_wickets) + 1,
+                'player_id': player_id if player_id in state.players else None,
+                'name': state.roster.name(player_id),
+                'over': float(f"{ball.over_number}.{ball.ball_number}"),
+            })
+            return
+        innings.partnership_runs += ball.total_runs
+        if not (ball.is_wide or ball.is_no_ball):
+            innings.partnership_balls += 1
+
+    def _handle_strike_rotation(self, state, ball):
         # If runs are odd (1, 3, 5), they swap.
         # If over ends (6 legal balls), they swap (after the runs swap).
-        
-        swap_ends = (ball.runs_batter % 2 != 0)
-        
-        # Check Over End
-        legal_balls = Ball.objects.filter(match=match, innings=match.current_innings, is_wide=False, is_no_ball=False).count()
-        over_complete = (legal_balls % 6 == 0) and (legal_balls > 0)
-        
-        if over_complete:
-            swap_ends = not swap_ends
-            
-        # If swap_ends is True, the NON-STRIKER becomes the striker for next ball.
-        # If False, the STRIKER remains.
-        
-        # Update is_on_strike flags
-        # Reset all active batters to False first (safer)
-        BattingScore.objects.filter(match=match, innings=match.current_innings, is_out=False).update(is_on_strike=False)
-        
-        if swap_ends:
-            # Non-striker becomes striker
-            # We need to find the non-striker's BattingScore
-            new_striker = non_striker
+        # If the striker is out, the new batter takes strike.
+        innings = state.innings
+        striker_id = innings.striker_id
+        non_striker_id = innings.non_striker_id
+
+        if ball.is_wicket and ball.dismissed_player_id == striker_id:
+            innings.striker_id = None
         else:
-            # Striker remains striker (unless out?)
-            # If striker is OUT, then the NEW batter will be on strike?
-            # Or does the new batter take the specific end?
-            # Standard rule: 
-            # If Caught: New batter comes to the end of the dismissed batter.
-            # If crossed: (Not implementing cross logic on catch yet).
-            # If Bowled/LBW: Striker's end.
-            
-            # If Wicket: 
-            # The dismissed player is already marked Out.
-            # The new player will be created/fetched in next _get_current_batters.
-            # Who is on strike? 
-            # If it was a wicket, the rule depends. 
-            # Simplified: New batter is always on strike if it was strike's wicket.
-            # If runout at non-striker end: Striker remains on strike (if no run taken).
-            
-            # Let's simplify: 
-            # If Wicket (Striker): New batter is On Strike.
-            # If Wicket (Non-Striker): Striker remains On Strike.
-            
-            if ball.is_wicket and ball.dismissed_player == striker:
-                # Striker is out. New batter (not yet assigned) will be On Strike.
-                # We can't set is_on_strike for a player who doesn't exist yet.
-                # But existing non-striker should NOT be on strike.
-                BattingScore.objects.filter(match=match, player=non_striker, innings=match.current_innings).update(is_on_strike=False)
-                return # Next loop will pick new batter and set valid flags? No, we need to enforce on-strike for the new one.
-                # Actually, if we set non-striker=False, the logic in _get_current_batters needs to default the NEW guy to True.
-                pass
-            else:
-                 new_striker = striker
-
-        # Set new striker to True
-        if not (ball.is_wicket and ball.dismissed_player == striker):
-             BattingScore.objects.filter(match=match, player=new_striker, innings=match.current_innings).update(is_on_strike=True)
-
-    def _handle_innings_break(self, match, innings_score):
+            swap_ends = (ball.runs_batter % 2 != 0)
+            is_legal = not (ball.is_wide or ball.is_no_ball)
+            if is_legal and innings.legal_balls % 6 == 0:
+                swap_ends = not swap_ends
+            if swap_ends:
+                innings.striker_id, innings.non_striker_id = non_striker_id, striker_id
+
+        for player_id in (striker_id, non_striker_id):
+            score = innings.batting_scores.get(player_id)
+            on_strike = (player_id == innings.striker_id)
+            if score is not None and score.is_on_strike != on_strike:
+                score.is_on_strike = on_strike
+                state.mark_dirty(score)
+
+    def _handle_innings_break(self, match, state):
         if match.current_innings == 1:
             match.current_innings = 2
-            match.save()
+            state.mark_dirty(match)
+            state.begin_innings(match)
             print(f"Match {match.id}: Innings 1 Complete. Starting Innings 2.")
         else:
             match.match_ended = True
             match.is_live = False
-            match.save()
+            state.mark_dirty(match)
             print(f"Match {match.id}: Match Completed.")
 
-    def _build_ws_payload(self, match, innings_score, ball, striker, non_striker, bowler, extra_type, run_rate):
-        match_info = self._build_match_info_payload(match)
-        teams_payload = self._build_teams_payload(match)
-        batsmen_payload = self._build_batsmen_payload(match)
-        bowler_payload = self._build_bowler_payload(match, bowler)
-        partnership_payload = self._build_partnership_payload(match)
-        fall_of_wickets_payload = self._build_fall_of_wickets(match)
-        last_6_balls_payload = self._build_last_6_balls(match)
-        extras_payload = self._build_extras_payload(match)
-        events_payload = self._build_events_payload(ball, striker)
-
+    def _build_ws_payload(self, match, state, innings, ball, striker, non_striker, bowler, extra_type, run_rate):
+        roster = state.roster
+        match_info = self._build_match_info_payload(match, roster)
+        teams_payload = self._build_teams_payload(roster)
+        batsmen_payload = self._build_batsmen_payload(innings, roster)
+        bowler_payload = self._build_bowler_payload(innings, bowler, roster)
+        partnership_payload = self._build_partnership_payload(innings, roster)
+        fall_of_wickets_payload = self._build_fall_of_wickets(innings)
+        last_6_balls_payload = self._build_last_6_balls(innings)
+        extras_payload = self._build_extras_payload(innings)
+        events_payload = self._build_events_payload(state, ball, striker)
+
+        innings_score = innings.innings_score
         batting_team = innings_score.team
-        bowling_team = self._get_bowling_team(match)
+        bowling_team = state.bowling_team(innings.innings)
+        projected_score, batting_win, tie = project(
+            innings.innings,
+            innings_score.total_runs,
+            innings_score.total_wickets,
+            innings.legal_balls,
+            innings.target,
+        )
 
         last_ball_payload = {
             'over': ball.over_number,
@@ -398,9 +534,9 @@ class SimulationEngine:
             'extras': ball.extras,
             'extra_type': extra_type,
             'is_wicket': ball.is_wicket,
-            'striker': {'player_id': striker.id, 'name': f"{striker.first_name} {striker.last_name}"},
-            'non_striker': {'player_id': non_striker.id, 'name': f"{non_striker.first_name} {non_striker.last_name}"},
-            'bowler': {'player_id': bowler.id, 'name': f"{bowler.first_name} {bowler.last_name}"},
+            'striker': {'player_id': striker.id, 'name': roster.name(striker.id)},
+            'non_striker': {'player_id': non_striker.id, 'name': roster.name(non_striker.id)},
+            'bowler': {'player_id': bowler.id, 'name': roster.name(bowler.id)},
             'dismissal': ball.dismissal_type,
         }
 
@@ -418,6 +554,7 @@ class SimulationEngine:
         payload = {
             'type': 'BALL_UPDATE',
             'matchId': match.id,
+            'seq': state.seq,
             'matchInfo': match_info,
             'teams': teams_payload,
             'score': {
@@ -427,7 +564,14 @@ class SimulationEngine:
                 'overs': innings_score.total_overs,
                 'run_rate': round(run_rate, 2),
                 'required_run_rate': None,
+                'target': innings.target,
+                'projected_score': projected_score,
             },
+            'winProbability': [
+                {'team_id': batting_team.id, 'probability': batting_win},
+                {'team_id': bowling_team.id, 'probability': round(1 - batting_win - tie, 3)},
+            ],
+            'tieProbability': tie,
             'currentInnings': current_innings,
             'extras': extras_payload,
             'events': events_payload,
@@ -435,13 +579,14 @@ class SimulationEngine:
 
         return payload
 
-    def _build_batsmen_payload(self, match):
-        scores = BattingScore.objects.filter(match=match, innings=match.current_innings, is_out=False)
+    def _build_batsmen_payload(self, innings, roster):
         payload = []
-        for s in scores:
+        for s in innings.batting_scores.values():
+            if s.is_out:
+                continue
             payload.append({
-                'player_id': s.player.id,
-                'name': f"{s.player.first_name} {s.player.last_name}",
+                'player_id': s.player_id,
+                'name': roster.name(s.player_id),
                 'runs': s.runs,
                 'balls': s.balls_faced,
                 'fours': s.fours,
@@ -451,12 +596,12 @@ class SimulationEngine:
             })
         return payload
 
-    def _build_bowler_payload(self, match, bowler):
-        score = BowlingScore.objects.filter(match=match, innings=match.current_innings, player=bowler).first()
+    def _build_bowler_payload(self, innings, bowler, roster):
+        score = innings.bowling_scores.get(bowler.id)
         if not score:
             return {
                 'player_id': bowler.id,
-                'name': f"{bowler.first_name} {bowler.last_name}",
+                'name': roster.name(bowler.id),
                 'overs': 0.0,
                 'maidens': 0,
                 'runs_conceded': 0,
@@ -465,7 +610,7 @@ class SimulationEngine:
             }
         return {
             'player_id': bowler.id,
-            'name': f"{bowler.first_name} {bowler.last_name}",
+            'name': roster.name(bowler.id),
             'overs': score.overs,
             'maidens': score.maidens,
             'runs_conceded': score.runs_conceded,
@@ -473,120 +618,54 @@ class SimulationEngine:
             'economy': round(score.economy, 2),
         }
 
-    def _build_partnership_payload(self, match):
-        last_wicket_ball = Ball.objects.filter(
-            match=match, innings=match.current_innings, is_wicket=True
-        ).order_by('-id').first()
-
-        balls_qs = Ball.objects.filter(match=match, innings=match.current_innings)
-        if last_wicket_ball:
-            balls_qs = balls_qs.filter(id__gt=last_wicket_ball.id)
-
-        runs = balls_qs.aggregate(total=models.Sum('total_runs')).get('total') or 0
-        balls = balls_qs.filter(is_wide=False, is_no_ball=False).count()
-
-        batsmen = self._build_batsmen_payload(match)
-        return {'runs': runs, 'balls': balls, 'batsmen': [{'player_id': b['player_id'], 'name': b['name']} for b in batsmen]}
-
-    def _build_fall_of_wickets(self, match):
-        balls = Ball.objects.filter(match=match, innings=match.current_innings).order_by('id')
-        fall = []
-        total = 0
-        wickets = 0
-        for b in balls:
-            total += b.total_runs
-            if b.is_wicket:
-                wickets += 1
-                fall.append({
-                    'score': total,
-                    'wicket': wickets,
-                    'player_id': b.dismissed_player.id if b.dismissed_player else None,
-                    'name': f"{b.dismissed_player.first_name} {b.dismissed_player.last_name}" if b.dismissed_player else None,
-                    'over': float(f"{b.over_number}.{b.ball_number}"),
-                })
-        return fall
-
-    def _build_last_6_balls(self, match):
-        balls = Ball.objects.filter(match=match, innings=match.current_innings).order_by('-id')[:6]
-        payload = []
-        for b in reversed(list(balls)):
-            payload.append({
-                'over': float(f"{b.over_number}.{b.ball_number}"),
-                'runs': b.total_runs,
-            })
-        return payload
+    def _build_partnership_payload(self, innings, roster):
+        batsmen = self._build_batsmen_payload(innings, roster)
+        return {
+            'runs': innings.partnership_runs,
+            'balls': innings.partnership_balls,
+            'batsmen': [{'player_id': b['player_id'], 'name': b['name']} for b in batsmen],
+        }
+
+    def _build_fall_of_wickets(self, innings):
+        return list(innings.fall_of_wickets)
 
-    def _build_match_info_payload(self, match):
-        tournament = match.tournament
+    def _build_last_6_balls(self, innings):
+        return list(innings.last_balls)
+
+    def _build_match_info_payload(self, match, roster):
         status = "LIVE" if match.is_live and not match.match_ended else "COMPLETED" if match.match_ended else "PAUSED"
         overs_per_innings = 20 if match.match_type == "T20" else 50 if match.match_type == "ODI" else 0
-        teams = list(match.teams.all())
-        match_name = " vs ".join([t.name for t in teams]) if teams else f"Match {match.id}"
         return {
             'matchId': match.id,
-            'matchName': match_name,
-            'tournament': {
-                'id': str(tournament.id) if tournament else None,
-                'name': tournament.name if tournament else None,
-                'code': tournament.code if tournament else None,
-            },
+            'matchName': roster.match_name,
+            'tournament': roster.tournament,
             'venue': match.venue,
             'startTime': match.date.isoformat().replace('+00:00', 'Z'),
             'status': status,
             'overs_per_innings': overs_per_innings,
         }
 
-    def _build_teams_payload(self, match):
-        teams_payload = []
-        for team in match.teams.all():
-            squad_entries = PlayingSquad.objects.filter(match=match, team=team).select_related('player')
-            squad = []
-            for sq in squad_entries:
-                player = sq.player
-                squad.append({
-                    'player_id': player.id,
-                    'name': f"{player.first_name} {player.last_name}",
-                    'role': player.role,
-                    'batting_hand': player.batting_hand,
-                    'bowling_style': player.bowling_style,
-                    'is_captain': sq.is_captain,
-                    'is_wicket_keeper': sq.is_wicket_keeper,
-                })
-            teams_payload.append({
-                'id': team.id,
-                'name': team.name,
-                'short_name': team.short_name,
-                'logo_url': team.logo_url,
-                'squad': squad,
-            })
-        return teams_payload
-
-    def _build_extras_payload(self, match):
-        balls = Ball.objects.filter(match=match, innings=match.current_innings)
-        wides = balls.filter(is_wide=True).count()
-        no_balls = balls.filter(is_no_ball=True).count()
-        byes = balls.filter(is_bye=True).count()
-        leg_byes = balls.filter(is_leg_bye=True).count()
-        return {
-            'wides': wides,
-            'no_balls': no_balls,
-            'byes': byes,
-            'leg_byes': leg_byes,
-        }
+    def _build_teams_payload(self, roster):
+        # Built once per match by MatchRoster; squads cannot change while live
+        return roster.teams_payload
+
+    def _build_extras_payload(self, innings):
+        return dict(innings.extras)
 
-    def _build_events_payload(self, ball, striker):
+    def _build_events_payload(self, state, ball, striker):
         events = []
         if ball.runs_batter >= 4:
             events.append({
                 'type': 'commentary',
-                'text': f"{striker.first_name} {striker.last_name} hits a {ball.runs_batter}!",
+                'text': f"{state.roster.name(striker.id)} hits a {ball.runs_batter}!",
                 'over': float(f"{ball.over_number}.{ball.ball_number}"),
             })
         if ball.is_wicket:
+            dismissed_id = ball.dismissed_player_id
             events.append({
                 'type': 'wicket',
-                'player_id': ball.dismissed_player.id if ball.dismissed_player else None,
-                'name': f"{ball.dismissed_player.first_name} {ball.dismissed_player.last_name}" if ball.dismissed_player else None,
+                'player_id': dismissed_id if dismissed_id in state.players else None,
+                'name': state.roster.name(dismissed_id),
                 'over': float(f"{ball.over_number}.{ball.ball_number}"),
             })
         return events
@@ -0,0 +1,78 @@
+import asyncio
+from functools import partial
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.db import transaction
+
+# Channel layer group every simulation scheduler listens on
+SIMULATION_GROUP = 'simulation'
+
+# Group memberships expire on the channel layer (after a day by default),
+# so listeners join again this often
+GROUP_REJOIN_SECONDS = 3600
+
+# notify(match_id) of every scheduler running in this process
+_listeners = []
+
+
+def add_listener(callback):
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def shares_channel_layer(layer):
+    # An in-memory layer only reaches this process, which _listeners already covers
+    return layer is not None and not isinstance(layer, InMemoryChannelLayer)
+
+
+def publish_match_change(match_id):
+    """
+    Tell every scheduler that a match was started, paused, reset, sped up or
+    fast-forwarded, so it re-reads that match at once instead of on its next
+    reconcile. Sent when the current transaction commits, so the scheduler
+    never reads the row before the change is visible.
+    """
+    transaction.on_commit(partial(_publish, match_id))
+
+
+def _publish(match_id):
+    for callback in list(_listeners):
+        callback(match_id)
+
+    channel_layer = get_channel_layer()
+    if not shares_channel_layer(channel_layer):
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            SIMULATION_GROUP,
+            {'type': 'match.changed', 'match_id': match_id},
+        )
+    except Exception as e:
+        # Not fatal: the schedulers' periodic reconcile still picks it up
+        print(f"Match {match_id}: Could not publish change: {e}")
+
+
+async def listen(callback):
+    """Pass the match ids of changes published by other processes to `callback`."""
+    channel_layer = get_channel_layer()
+    if not shares_channel_layer(channel_layer):
+        return
+    channel = await channel_layer.new_channel()
+
+    async def rejoin():
+        while True:
+            await channel_layer.group_add(SIMULATION_GROUP, channel)
+            await asyncio.sleep(GROUP_REJOIN_SECONDS)
+
+    rejoining = asyncio.ensure_future(rejoin())
+    try:
+        while True:
+            message = await channel_layer.receive(channel)
+            callback(message.get('match_id'))
+    finally:
+        rejoining.cancel()
+        await channel_layer.group_discard(SIMULATION_GROUP, channel)
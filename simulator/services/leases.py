@@ -0,0 +1,97 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import DateTimeField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+from simulator.models import Match
+
+
+def default_owner():
+    # Unique per process, and readable in the admin when debugging a stuck match
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class MatchLease:
+    """
+    Makes sure each live match is simulated by exactly one process. A
+    worker owns a match while Match.lease_expires is in the future; it
+    claims and renews its matches with a conditional UPDATE, so two workers
+    can never both succeed, and a worker that dies simply stops renewing
+    and its matches are taken over once the lease runs out.
+
+    With `shards` > 1 the matches are partitioned by id: a worker claims the
+    free matches of its own shard (id % shards == shard) and only takes over
+    another shard's match when its lease has been expired for a whole
+    lease period, i.e. that shard's workers are gone. lease_expires is never
+    NULL (new and released matches get the current time), so that rule
+    covers matches that were never leased or were given up too.
+
+    A worker that stalls past its lease could still be mid-tick when another
+    worker takes over; fence() is checked inside the tick's transaction so
+    its writes are dropped instead of interleaving with the new owner's.
+    """
+
+    def __init__(self, owner=None, duration=None, shard=0, shards=1):
+        self.owner = owner or default_owner()
+        if duration is None:
+            duration = getattr(settings, 'SIMULATION_LEASE_SECONDS', 30.0)
+        self.duration = timedelta(seconds=duration)
+        self.shard = shard
+        self.shards = shards
+
+    def claim(self, match_ids):
+        """Claim or renew the given matches; returns the ids this worker now owns."""
+        match_ids = list(match_ids)
+        if not match_ids:
+            return set()
+        # Times come from the database's clock, so workers on different
+        # hosts agree on when a lease has run out
+        now = Now()
+        until = ExpressionWrapper(now + self.duration, output_field=DateTimeField())
+        abandoned = ExpressionWrapper(now - self.duration, output_field=DateTimeField())
+        ours = Q(lease_owner=self.owner)
+
+        home = [match_id for match_id in match_ids if match_id % self.shards == self.shard]
+        other = [match_id for match_id in match_ids if match_id % self.shards != self.shard]
+        if home:
+            Match.objects.filter(
+                ours | Q(lease_expires__lte=now),
+                id__in=home,
+            ).update(lease_owner=self.owner, lease_expires=until)
+        if other:
+            Match.objects.filter(
+                ours | Q(lease_expires__lt=abandoned),
+                id__in=other,
+            ).update(lease_owner=self.owner, lease_expires=until)
+
+        return set(Match.objects.filter(id__in=match_ids, lease_owner=self.owner).values_list('id', flat=True))
+
+    def fence(self, match_ids):
+        """
+        Renew the given matches and return the ids this worker still holds.
+        Call inside the transaction that writes them: the renewal locks the
+        rows until commit, so no other worker can claim them in between.
+        """
+        match_ids = list(match_ids)
+        if not match_ids:
+            return set()
+        now = Now()
+        until = ExpressionWrapper(now + self.duration, output_field=DateTimeField())
+        held = Match.objects.filter(id__in=match_ids, lease_owner=self.owner, lease_expires__gt=now)
+        held.update(lease_expires=until)
+        return set(held.values_list('id', flat=True))
+
+    def release(self, match_ids, handover=False):
+        """
+        Give matches up at once (paused, finished, or this worker is
+        stopping). With `handover` they are left expired for a whole lease
+        period, so workers of other shards can take them over straight away.
+        """
+        match_ids = list(match_ids)
+        if match_ids:
+            expires = Now()
+            if handover:
+                expires = ExpressionWrapper(expires - self.duration, output_field=DateTimeField())
+            Match.objects.filter(id__in=match_ids, lease_owner=self.owner).update(lease_owner='', lease_expires=expires)
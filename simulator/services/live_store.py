@@ -0,0 +1,192 @@
+"""
+Latest encoded state of each live match, written by the engine after every
+ball and read by MatchConsumer, so a connecting client gets a snapshot
+without a database query. The last RING_SIZE balls are kept as well, so a
+client that reconnects with `since=<seq>` can be sent just what it missed.
+Consumers also count their viewers here, so the engine can skip building
+updates for matches nobody is watching.
+
+The backend is chosen by settings.LIVE_STORE, alongside CHANNEL_LAYERS: in
+process memory by default, Redis when REDIS_URL is set (so an engine running
+in `run_simulation` and the web servers share it).
+"""
+import threading
+from collections import deque
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Snapshots of matches nobody has touched for this long are dropped (Redis)
+SNAPSHOT_TTL = 24 * 60 * 60
+
+# Balls kept per match for resuming clients; older gaps get a snapshot
+RING_SIZE = 60
+
+
+def _consecutive_since(entries, seq):
+    """
+    The entries after `seq` from a ring of (seq, text, delta_text), or None
+    if the ring does not reach back that far. A seq written twice (the
+    engine retried a ball after a failed write) keeps the later entry.
+    """
+    by_seq = {}
+    for entry in entries:
+        by_seq[entry[0]] = entry
+    if not by_seq or seq > max(by_seq):
+        return None
+    missed = []
+    current = seq + 1
+    while current in by_seq:
+        missed.append(by_seq[current])
+        current += 1
+    if current <= max(by_seq):
+        return None # Ring starts after `seq`, or has a hole
+    return missed
+
+
+class InMemoryLiveStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._rings = {}
+        self._viewers = {}
+
+    def set_snapshot(self, match_id, seq, text):
+        with self._lock:
+            self._snapshots[int(match_id)] = (seq, text)
+
+    def record_ball(self, match_id, seq, text, delta_text):
+        """Store a ball as the latest snapshot and add it to the match's ring."""
+        match_id = int(match_id)
+        with self._lock:
+            self._snapshots[match_id] = (seq, text)
+            ring = self._rings.setdefault(match_id, deque(maxlen=RING_SIZE))
+            while ring and ring[-1][0] >= seq:
+                ring.pop()
+            ring.append((seq, text, delta_text))
+
+    def balls_since(self, match_id, seq):
+        """[(seq, text, delta_text), ...] after `seq`, or None if they are no longer all kept."""
+        with self._lock:
+            entries = list(self._rings.get(int(match_id), ()))
+        return _consecutive_since(entries, seq)
+
+    def add_snapshot(self, match_id, seq, text):
+        """Store only if there is no snapshot yet; the engine's writes always win."""
+        with self._lock:
+            self._snapshots.setdefault(int(match_id), (seq, text))
+
+    def get_snapshot(self, match_id):
+        """(seq, encoded payload), or None if nothing has been stored."""
+        return self._snapshots.get(int(match_id))
+
+    def clear(self, match_id):
+        with self._lock:
+            self._snapshots.pop(int(match_id), None)
+            self._rings.pop(int(match_id), None)
+
+    def add_viewer(self, match_id):
+        with self._lock:
+            self._viewers[int(match_id)] = self._viewers.get(int(match_id), 0) + 1
+
+    def remove_viewer(self, match_id):
+        """
+        Forget a viewer. The last one to leave also drops the match's stored
+        state, which stops being updated while nobody is watching.
+        """
+        match_id = int(match_id)
+        with self._lock:
+            count = self._viewers.get(match_id, 0) - 1
+            if count > 0:
+                self._viewers[match_id] = count
+            else:
+                self._viewers.pop(match_id, None)
+                self._snapshots.pop(match_id, None)
+                self._rings.pop(match_id, None)
+
+    def viewer_counts(self, match_ids):
+        """match_id -> number of connected viewers, for each of `match_ids`."""
+        return {match_id: self._viewers.get(int(match_id), 0) for match_id in match_ids}
+
+
+class RedisLiveStore:
+    def __init__(self, url, prefix='live'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, match_id):
+        return f"{self._prefix}:match:{int(match_id)}:snapshot"
+
+    def _ring_key(self, match_id):
+        return f"{self._prefix}:match:{int(match_id)}:balls"
+
+    def _viewers_key(self, match_id):
+        return f"{self._prefix}:match:{int(match_id)}:viewers"
+
+    # One string per match, "<seq>\n<text>", so a snapshot is always read
+    # and written as a whole
+    def set_snapshot(self, match_id, seq, text):
+        self._redis.set(self._key(match_id), f"{seq}\n{text}", ex=SNAPSHOT_TTL)
+
+    def add_snapshot(self, match_id, seq, text):
+        self._redis.set(self._key(match_id), f"{seq}\n{text}", ex=SNAPSHOT_TTL, nx=True)
+
+    # Ring entries are "<seq>\n<text>\n<delta text>"; encoded JSON never
+    # contains a raw newline
+    def record_ball(self, match_id, seq, text, delta_text):
+        ring_key = self._ring_key(match_id)
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(match_id), f"{seq}\n{text}", ex=SNAPSHOT_TTL)
+        pipe.rpush(ring_key, f"{seq}\n{text}\n{delta_text or ''}")
+        pipe.ltrim(ring_key, -RING_SIZE, -1)
+        pipe.expire(ring_key, SNAPSHOT_TTL)
+        pipe.execute()
+
+    def balls_since(self, match_id, seq):
+        entries = []
+        for value in self._redis.lrange(self._ring_key(match_id), 0, -1):
+            entry_seq, text, delta_text = value.decode().split('\n', 2)
+            entries.append((int(entry_seq), text, delta_text or None))
+        return _consecutive_since(entries, seq)
+
+    def get_snapshot(self, match_id):
+        value = self._redis.get(self._key(match_id))
+        if value is None:
+            return None
+        seq, text = value.decode().split('\n', 1)
+        return int(seq), text
+
+    def clear(self, match_id):
+        self._redis.delete(self._key(match_id), self._ring_key(match_id))
+
+    # Counts are shared by every web server. A server that dies without
+    # disconnecting its clients leaves its viewers counted, which only means
+    # updates keep being built for that match.
+    def add_viewer(self, match_id):
+        self._redis.incr(self._viewers_key(match_id))
+
+    def remove_viewer(self, match_id):
+        if self._redis.decr(self._viewers_key(match_id)) <= 0:
+            self.clear(match_id)
+
+    def viewer_counts(self, match_ids):
+        match_ids = list(match_ids)
+        if not match_ids:
+            return {}
+        values = self._redis.mget([self._viewers_key(match_id) for match_id in match_ids])
+        return {match_id: max(int(value or 0), 0) for match_id, value in zip(match_ids, values)}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_live_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'LIVE_STORE', {})
+                backend = import_string(config.get('BACKEND', 'simulator.services.live_store.InMemoryLiveStore'))
+                _store = backend(**config.get('CONFIG', {}))
+    return _store
@@ -0,0 +1,131 @@
+import math
+import numpy as np
+from simulator.services.outcomes import OUTCOMES, WEIGHTS, STANDARD, WICKET_WINDOW, WICKET_WINDOW_OVERS
+
+ALL_OUT = 10
+
+# Per-outcome columns of the model in services/outcomes.py, indexed like OUTCOMES
+OUTCOME_RUNS = np.array([o['runs'] + o['extras'] for o in OUTCOMES], dtype=np.int32)
+OUTCOME_WICKET = np.array([o['is_wicket'] for o in OUTCOMES], dtype=np.int32)
+OUTCOME_LEGAL = np.array([not (o['is_wide'] or o['is_no_ball']) for o in OUTCOMES], dtype=np.int32)
+
+
+# Integer weights let every context share one exact lookup: a ticket drawn
+# uniformly from [0, TICKETS) maps straight to an outcome index in each
+# context, which is a gather instead of a search per cell.
+TICKETS = math.lcm(*(sum(w) for w in WEIGHTS.values()))
+
+
+def _lookup(weights):
+    return np.repeat(np.arange(len(weights)), [w * (TICKETS // sum(weights)) for w in weights])
+
+
+STANDARD_LOOKUP = _lookup(WEIGHTS[STANDARD])
+WICKET_WINDOW_LOOKUP = _lookup(WEIGHTS[WICKET_WINDOW])
+
+
+class MonteCarloEngine:
+    """
+    Simulates many innings at once with NumPy: one row per simulation and
+    one column per delivery. Uses the same outcome model as
+    SimulationEngine._determine_outcome, including the over 3-5 wicket boost,
+    and the same rule that an innings lasts until ten wickets have fallen
+    (optionally also ending on a target or a legal-ball limit).
+    """
+
+    def __init__(self, seed=None, block_balls=360):
+        self.rng = np.random.default_rng(seed)
+        self.block_balls = block_balls
+
+    def simulate_innings(self, simulations, runs=0, wickets=0, legal_balls=0, target=None, max_legal_balls=None):
+        """
+        Continue an innings from (runs, wickets, legal_balls) in `simulations`
+        independent rows. `target` may be a scalar or one value per row.
+        Returns a dict of arrays: runs, wickets, legal_balls, balls.
+        """
+        runs = np.full(simulations, runs, dtype=np.int64)
+        wickets = np.full(simulations, wickets, dtype=np.int64)
+        legal = np.full(simulations, legal_balls, dtype=np.int64)
+        balls = np.zeros(simulations, dtype=np.int64)
+        target = None if target is None else np.broadcast_to(np.asarray(target, dtype=np.int64), (simulations,))
+
+        active = ~self._finished(runs, wickets, legal, target, max_legal_balls)
+        # Blocks of `block_balls` columns; rows still batting after a block
+        # (very long innings) continue in the next one.
+        while active.any():
+            rows = np.flatnonzero(active)
+            block = self._simulate_block(
+                runs[rows], wickets[rows], legal[rows],
+                None if target is None else target[rows],
+                max_legal_balls,
+            )
+            runs[rows], wickets[rows], legal[rows] = block['runs'], block['wickets'], block['legal_balls']
+            balls[rows] += block['balls']
+            active[rows] = ~block['finished']
+
+        return {'runs': runs, 'wickets': wickets, 'legal_balls': legal, 'balls': balls}
+
+    def simulate_match(self, simulations):
+        """Both innings of `simulations` matches; the chase stops once the target is passed."""
+        first = self.simulate_innings(simulations)
+        second = self.simulate_innings(simulations, target=first['runs'] + 1)
+        return {
+            'first_innings': first,
+            'second_innings': second,
+            'chasing_team_won': second['runs'] > first['runs'],
+            'tied': second['runs'] == first['runs'],
+        }
+
+    def _finished(self, runs, wickets, legal, target, max_legal_balls):
+        finished = wickets >= ALL_OUT
+        if target is not None:
+            finished |= runs >= target
+        if max_legal_balls is not None:
+            finished |= legal >= max_legal_balls
+        return finished
+
+    def _simulate_block(self, runs, wickets, legal, target, max_legal_balls):
+        n, width = len(runs), self.block_balls
+        tickets = self.rng.integers(0, TICKETS, size=(n, width))
+
+        # The outcome of every cell under either context, from the same draw
+        standard = STANDARD_LOOKUP[tickets]
+        boosted = WICKET_WINDOW_LOOKUP[tickets]
+
+        # A delivery's context depends on the legal balls before it, which
+        # depends on earlier wides. Start by assuming every ball is legal and
+        # recompute until the contexts stop changing; each pass fixes at least
+        # the next column, and in practice two or three passes suffice.
+        column = np.arange(width)
+        legal_before = legal[:, None] + column[None, :]
+        window = None
+        for _ in range(width + 1):
+            over = legal_before // 6
+            new_window = (over >= WICKET_WINDOW_OVERS[0]) & (over <= WICKET_WINDOW_OVERS[1])
+            if window is not None and np.array_equal(new_window, window):
+                break
+            window = new_window
+            outcome = np.where(window, boosted, standard)
+            is_legal = OUTCOME_LEGAL[outcome]
+            legal_before = legal[:, None] + np.cumsum(is_legal, axis=1) - is_legal
+
+        runs_cum = runs[:, None] + np.cumsum(OUTCOME_RUNS[outcome], axis=1)
+        wickets_cum = wickets[:, None] + np.cumsum(OUTCOME_WICKET[outcome], axis=1)
+        legal_cum = legal_before + is_legal
+
+        ended = wickets_cum >= ALL_OUT
+        if target is not None:
+            ended |= runs_cum >= target[:, None]
+        if max_legal_balls is not None:
+            ended |= legal_cum >= max_legal_balls
+
+        finished = ended.any(axis=1)
+        last = np.where(finished, ended.argmax(axis=1), width - 1)
+        rows = np.arange(n)
+        return {
+            'runs': runs_cum[rows, last],
+            'wickets': wickets_cum[rows, last],
+            'legal_balls': legal_cum[rows, last],
+            'balls': last + 1,
+            'finished': finished,
+        }
@@ -0,0 +1,81 @@
+import random
+from types import MappingProxyType
+
+# Ball outcomes, shared by every sample. Read-only so a caller cannot
+# accidentally change the outcome of every later ball.
+OUTCOMES = tuple(MappingProxyType(o) for o in (
+    {'runs': 0, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False, 'dismissal_type': None}, # Dot
+    {'runs': 1, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False, 'dismissal_type': None}, # Single
+    {'runs': 2, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False, 'dismissal_type': None}, # Double
+    {'runs': 4, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False, 'dismissal_type': None}, # Four
+    {'runs': 6, 'extras': 0, 'is_wicket': False, 'is_wide': False, 'is_no_ball': False, 'dismissal_type': None}, # Six
+    {'runs': 0, 'extras': 0, 'is_wicket': True,  'is_wide': False, 'is_no_ball': False, 'dismissal_type': 'CAUGHT'}, # Wicket
+    {'runs': 0, 'extras': 1, 'is_wicket': False, 'is_wide': True,  'is_no_ball': False, 'dismissal_type': None}, # Wide
+))
+
+# Context -> weights over OUTCOMES. The model currently only distinguishes
+# overs 3-5 (inclusive), where wickets are encouraged.
+STANDARD = 'STANDARD'
+WICKET_WINDOW = 'WICKET_WINDOW'
+WICKET_WINDOW_OVERS = (3, 5)
+WEIGHTS = {
+    STANDARD: (40, 30, 5, 8, 4, 3, 2),
+    WICKET_WINDOW: (38, 29, 5, 8, 4, 8, 2),
+}
+
+
+def context_for(over_number):
+    if WICKET_WINDOW_OVERS[0] <= over_number <= WICKET_WINDOW_OVERS[1]:
+        return WICKET_WINDOW
+    return STANDARD
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table: draws one of `outcomes` with probability
+    proportional to `weights` using a single random() call and no
+    allocation, however many outcomes there are.
+    """
+
+    __slots__ = ('outcomes', 'prob', 'alias', 'n')
+
+    def __init__(self, outcomes, weights):
+        n = len(outcomes)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left is 1.0 up to rounding error
+
+        self.outcomes = tuple(outcomes)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+        self.n = n
+
+    def sample(self, rng=random):
+        u = rng.random() * self.n
+        i = int(u)
+        if u - i < self.prob[i]:
+            return self.outcomes[i]
+        return self.outcomes[self.alias[i]]
+
+
+# Compiled once at import; sampling never rebuilds them
+OUTCOME_TABLES = {context: AliasTable(OUTCOMES, weights) for context, weights in WEIGHTS.items()}
+
+
+def sample_outcome(over_number, rng=random):
+    return OUTCOME_TABLES[context_for(over_number)].sample(rng)
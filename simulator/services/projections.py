@@ -0,0 +1,61 @@
+from functools import lru_cache
+import numpy as np
+from simulator.services.montecarlo import MonteCarloEngine
+
+# Small enough to stay within a few milliseconds per ball, large enough for
+# win probabilities that move smoothly from ball to ball.
+SIMULATIONS = 200
+BLOCK_BALLS = 120
+
+# Full innings simulated once per process to price any first-innings total
+CHASE_SIMULATIONS = 10000
+
+
+@lru_cache(maxsize=1)
+def _chase_distribution():
+    """
+    P(a fresh innings makes exactly k runs) and P(it makes at least k runs),
+    indexed by k. A chase of target T succeeds exactly when the unstopped
+    innings would have reached T, so this prices every first-innings total.
+    """
+    totals = MonteCarloEngine(seed=0).simulate_innings(CHASE_SIMULATIONS)['runs']
+    exact = np.bincount(totals) / CHASE_SIMULATIONS
+    at_least = np.append(np.cumsum(exact[::-1])[::-1], 0.0)
+    return exact, at_least
+
+
+def _lookup(table, index):
+    return table[np.minimum(index, len(table) - 1)]
+
+
+@lru_cache(maxsize=8192)
+def project(innings, runs, wickets, legal_balls, target=None):
+    """
+    Project the rest of a match from the current innings state.
+
+    Returns (projected_score, batting_team_win_probability, tie_probability).
+    Results are cached by state, and the simulations are seeded from it, so
+    every match in the same state (and every process) gets the same answer.
+    """
+    key = [innings, runs, wickets, legal_balls, target or 0]
+    engine = MonteCarloEngine(seed=np.random.SeedSequence(key), block_balls=BLOCK_BALLS)
+
+    if innings == 1:
+        totals = engine.simulate_innings(SIMULATIONS, runs=runs, wickets=wickets, legal_balls=legal_balls)['runs']
+        exact, at_least = _chase_distribution()
+        chased = _lookup(at_least, totals + 1)
+        tied = np.where(totals < len(exact), _lookup(exact, totals), 0.0)
+        batting_won = 1.0 - chased - tied
+    else:
+        # The live engine bats the chase out rather than stopping at the
+        # target, so neither does the projection. Runs only go up, so the
+        # target was reached exactly when the final total is at least it.
+        totals = engine.simulate_innings(SIMULATIONS, runs=runs, wickets=wickets, legal_balls=legal_balls)['runs']
+        batting_won = totals >= target
+        tied = totals == target - 1
+
+    return (
+        int(round(totals.mean())),
+        round(float(batting_won.mean()), 3),
+        round(float(tied.mean()), 3),
+    )
@@ -0,0 +1,44 @@
+import copy
+from simulator.services.engine import SimulationEngine
+from simulator.services.state import MatchState
+
+
+class ReplayEngine(SimulationEngine):
+    """
+    Re-bowls a match from its seed entirely in memory. Only the teams and
+    squads are read; Ball and score rows are neither read nor written.
+    Because the live engine reseeds its stream for every delivery, the
+    replayed balls are identical to the ones it persisted.
+    """
+
+    def get_state(self, match):
+        state = self.states.get(match.id)
+        if state is None:
+            state = MatchState.start(match, self.get_roster(match))
+            self.states[match.id] = state
+        return state
+
+    def replay(self, match, deliveries=None):
+        """
+        Return the match's first `deliveries` balls (all of them if None) as
+        unsaved Ball instances, in the order they were bowled. The match
+        object passed in is not modified.
+        """
+        match = copy.copy(match)
+        match.current_innings = 1
+        match.match_ended = False
+        match.is_live = True
+
+        self.evict(match.id)
+        balls = []
+        try:
+            while not match.match_ended and (deliveries is None or len(balls) < deliveries):
+                innings = match.current_innings
+                delivery = self._advance(match)
+                if delivery:
+                    balls.append(delivery['ball'])
+                elif match.current_innings == innings and not match.match_ended:
+                    break # Could not bowl (e.g. not enough players)
+        finally:
+            self.evict(match.id)
+        return balls
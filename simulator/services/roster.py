@@ -0,0 +1,75 @@
+from simulator.models import Match, PlayingSquad
+
+
+class MatchRoster:
+    """
+    Everything about a match that is fixed once it goes live: the teams in
+    batting order, each squad, who can bowl, player display names and the
+    static parts of the broadcast payload. Built with three queries when
+    the engine first sees a match and shared by every ball after that.
+
+    The payload parts (teams_payload, tournament) are shared between balls;
+    treat them as read-only.
+    """
+
+    def __init__(self, match):
+        self.match_id = match.id
+
+        # Teams in the order they were added to the match (teams[0] bats first)
+        links = Match.teams.through.objects.filter(match=match).select_related('team').order_by('id')
+        self.teams = [link.team for link in links]
+        self.players = {}
+        self.names = {}
+        self.squads = {team.id: [] for team in self.teams}
+        for sq in PlayingSquad.objects.filter(match=match).select_related('player').order_by('id'):
+            self.players[sq.player_id] = sq.player
+            self.names[sq.player_id] = f"{sq.player.first_name} {sq.player.last_name}"
+            self.squads.setdefault(sq.team_id, []).append(sq)
+
+        self.bowling_options = {}
+        for team_id, squad in self.squads.items():
+            bowlers = [sq.player for sq in squad if sq.player.role in ['BOWLER', 'ALL_ROUNDER']]
+            self.bowling_options[team_id] = bowlers or [sq.player for sq in squad]
+
+        self.match_name = " vs ".join([t.name for t in self.teams]) if self.teams else f"Match {match.id}"
+        tournament = match.tournament
+        self.tournament = {
+            'id': str(tournament.id) if tournament else None,
+            'name': tournament.name if tournament else None,
+            'code': tournament.code if tournament else None,
+        }
+        self.teams_payload = [self._team_payload(team) for team in self.teams]
+
+    def batting_team(self, innings):
+        # Simplified: teams[0] bats first, teams[1] second
+        return self.teams[0] if innings == 1 else self.teams[1]
+
+    def bowling_team(self, innings):
+        return self.teams[1] if innings == 1 else self.teams[0]
+
+    def batting_order(self, team_id):
+        return [sq.player for sq in self.squads.get(team_id, [])]
+
+    def name(self, player_id):
+        return self.names.get(player_id)
+
+    def _team_payload(self, team):
+        squad = []
+        for sq in self.squads.get(team.id, []):
+            player = sq.player
+            squad.append({
+                'player_id': player.id,
+                'name': self.names[player.id],
+                'role': player.role,
+                'batting_hand': player.batting_hand,
+                'bowling_style': player.bowling_style,
+                'is_captain': sq.is_captain,
+                'is_wicket_keeper': sq.is_wicket_keeper,
+            })
+        return {
+            'id': team.id,
+            'name': team.name,
+            'short_name': team.short_name,
+            'logo_url': team.logo_url,
+            'squad': squad,
+        }
@@ -0,0 +1,373 @@
+import asyncio
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections
+from simulator.models import Match
+from simulator.services.engine import SimulationEngine
+from simulator.services.broadcaster import send_updates
+from simulator.services.leases import MatchLease
+from simulator.services import events
+
+
+class BallScheduler:
+    """
+    Runs the live matches of one process: a heap of (due time, match_id)
+    says which ball is next, and the loop sleeps exactly until then instead
+    of polling. Admin actions publish change events (services/events.py)
+    that call notify(match_id), and only those matches are re-read; the
+    full set of live matches is reconciled every `reconcile_interval`
+    seconds to renew leases and catch changes made outside the API.
+
+    A match is only run while this scheduler holds its lease (see
+    services/leases.py); leases are renewed on every reconcile, so several
+    schedulers, in web processes or `run_simulation` workers, can run side
+    by side without ever bowling the same match.
+
+    With `threads` > 1 the matches due in a tick are split into that many
+    chunks and handed to a thread pool, each chunk on its own thread and so
+    its own database connection and transaction. The scheduler does not
+    wait for them: a chunk's matches are rescheduled when it comes back, so
+    a slow match only holds up its own chunk and every other match keeps
+    its interval. A match is never due again while its chunk is running,
+    so its balls stay in order.
+    """
+
+    def __init__(self, engine=None, reconcile_interval=None, clock=time.monotonic, log=print, log_ticks=False, lease=None, threads=None):
+        self.engine = engine or SimulationEngine()
+        self.lease = lease or MatchLease()
+        if reconcile_interval is None:
+            reconcile_interval = getattr(settings, 'SIMULATION_RECONCILE_SECONDS', 5.0)
+        # Renew well before the lease runs out
+        self.reconcile_interval = min(reconcile_interval, self.lease.duration.total_seconds() / 3)
+        if threads is None:
+            threads = getattr(settings, 'SIMULATION_THREADS', 1)
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='simulation-tick') if threads > 1 else None
+        self.clock = clock
+        self.log = log
+        self.log_ticks = log_ticks
+
+        # match_id -> Match for every live match this scheduler runs
+        self.matches = {}
+        # match_id -> when its next ball is due; heap entries that disagree
+        # with this are stale and skipped when popped
+        self.due = {}
+        self.heap = []
+        self.next_reconcile = 0.0
+        # match_id -> due time of the ball a pool thread is bowling for it
+        self.in_flight = {}
+        # Matches changed or dropped while in flight; their state is evicted
+        # once the chunk is back, as the pool thread is still using it
+        self.stale = set()
+        # (due entries, error) of finished chunks, appended by pool threads
+        self.completed = deque()
+
+        self.refresh_requested = False
+        # Matches named by change events since the last tick
+        self.changed = set()
+        self.changed_lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def notify(self, match_id=None):
+        """
+        Re-read a match now, e.g. after it was started, paused, reset or sped
+        up; without a match_id every live match is re-read. Safe to call
+        from any thread.
+        """
+        with self.changed_lock:
+            if match_id is None:
+                self.refresh_requested = True
+            else:
+                self.changed.add(match_id)
+        self._wake()
+
+    def _wake(self):
+        self.wakeup.set()
+
+    def run_forever(self):
+        events.add_listener(self.notify)
+        threading.Thread(target=self._listen_forever, name="SimulationEvents", daemon=True).start()
+        try:
+            while True:
+                # Cleared first, so a wake-up that comes in during the tick is not lost
+                self.wakeup.clear()
+                try:
+                    # Long-lived thread: drop connections the server has closed
+                    close_old_connections()
+                    delay = self.run_once()
+                except Exception as e:
+                    self.log(f"Scheduler error: {e}")
+                    delay = 1.0
+                self.wakeup.wait(delay)
+        finally:
+            events.remove_listener(self.notify)
+            self.release_all()
+
+    def _listen_forever(self):
+        # Change events from other processes; only used with a shared channel layer
+        while True:
+            try:
+                asyncio.run(events.listen(self.notify))
+                return
+            except Exception as e:
+                self.log(f"Change listener error: {e}")
+                time.sleep(5)
+
+    def release_all(self):
+        """Hand every match back on shutdown, so other workers need not wait for the leases to expire."""
+        try:
+            self.lease.release(self.matches, handover=True)
+        except Exception as e:
+            self.log(f"Could not release leases: {e}")
+
+    def run_once(self):
+        """Bowl every ball that is due; returns the seconds until there is more to do."""
+        now = self.clock()
+        with self.changed_lock:
+            reconcile = self.refresh_requested or now >= self.next_reconcile
+            self.refresh_requested = False
+            changed, self.changed = self.changed, set()
+
+        # Reconciling first also renews the leases before any ball is bowled
+        if reconcile:
+            self.reconcile(now, changed)
+            self.next_reconcile = now + self.reconcile_interval
+        elif changed:
+            self.refresh(changed, now)
+
+        self._collect(now)
+        due = self._pop_due(now)
+        if due:
+            if self.log_ticks:
+                self.log(f"Simulating ball for Matches {[match_id for match_id, _ in due]}")
+            self._simulate(due, now)
+
+        return self.next_delay()
+
+    def next_delay(self):
+        next_at = self.next_reconcile
+        if self.heap:
+            next_at = min(next_at, self.heap[0][0])
+        return max(0.0, next_at - self.clock())
+
+    def _simulate(self, due, now):
+        if self.pool is None:
+            try:
+                self._simulate_chunk([self.matches[match_id] for match_id, _ in due])
+                self.completed.append((due, None))
+            except Exception as e:
+                self.completed.append((due, e))
+            self._collect(now)
+            return
+        for i in range(self.threads):
+            chunk = due[i::self.threads]
+            if not chunk:
+                continue
+            self.in_flight.update(chunk)
+            future = self.pool.submit(self._run_chunk, [self.matches[match_id] for match_id, _ in chunk])
+            future.add_done_callback(partial(self._chunk_done, chunk))
+
+    def _chunk_done(self, chunk, future):
+        # On the pool thread: hand the chunk back for run_once to reschedule
+        self.completed.append((chunk, future.exception()))
+        self._wake()
+
+    def _collect(self, now):
+        """Schedule the next ball of every match whose chunk has finished."""
+        while self.completed:
+            due, error = self.completed.popleft()
+            if error is not None:
+                self.log(f"Error in Matches {[match_id for match_id, _ in due]}: {error}")
+            for match_id, due_at in due:
+                self.in_flight.pop(match_id, None)
+                if match_id in self.stale:
+                    self.stale.discard(match_id)
+                    self.engine.evict(match_id)
+                self._reschedule(match_id, due_at, now)
+
+    def _run_chunk(self, matches):
+        # Pool threads are long-lived too and keep a connection each
+        close_old_connections()
+        self._simulate_chunk(matches)
+
+    def _simulate_chunk(self, matches):
+        self.engine.simulate_tick(matches, lease=self.lease)
+
+    def reconcile(self, now, changed=()):
+        live = {
+            match.id: match
+            for match in Match.objects.filter(is_live=True, match_ended=False).select_related('tournament')
+        }
+        # Matches another worker holds (or that we failed to renew) are not ours to run
+        owned = self.lease.claim(live)
+        live = {match_id: match for match_id, match in live.items() if match_id in owned}
+        for match_id in list(self.matches):
+            if match_id not in live:
+                self._drop(match_id)
+
+        for match_id, match in live.items():
+            self._update(match_id, match, now, match_id in changed)
+
+    def refresh(self, match_ids, now):
+        """Re-read just the matches named by change events."""
+        found = {
+            match.id: match
+            for match in Match.objects.filter(id__in=match_ids).select_related('tournament')
+        }
+        owned = self.lease.claim(
+            match_id for match_id, match in found.items() if match.is_live and not match.match_ended
+        )
+        for match_id in match_ids:
+            if match_id in owned:
+                self._update(match_id, found[match_id], now, True)
+            else:
+                self._drop(match_id)
+
+    def _update(self, match_id, match, now, changed):
+        previous = self.matches.get(match_id)
+        self.matches[match_id] = match
+        if changed or self._was_reset(previous, match):
+            # It may have been reset (and restarted) since its state was loaded
+            self._evict(match_id)
+        if match_id in self.in_flight:
+            return # Scheduled again, at its new speed, when its chunk is back
+        if previous is None:
+            self._schedule(match_id, now) # Newly live: first ball straight away
+        elif previous.seconds_per_ball != match.seconds_per_ball:
+            # Speed changed: the next ball follows the new interval from the last one
+            last_ball = self.due[match_id] - previous.seconds_per_ball
+            self._schedule(match_id, max(now, last_ball + match.seconds_per_ball))
+
+    def _was_reset(self, previous, match):
+        # Catches a reset whose change event never arrived: every reset draws
+        # a new seed, and the innings can only go backwards by a reset
+        if previous is None:
+            return False
+        return previous.seed != match.seed or match.current_innings < previous.current_innings
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_at, match_id = heapq.heappop(self.heap)
+            if self.due.get(match_id) == due_at:
+                due.append((match_id, due_at))
+        return due
+
+    def _schedule(self, match_id, due_at):
+        self.due[match_id] = due_at
+        heapq.heappush(self.heap, (due_at, match_id))
+
+    def _reschedule(self, match_id, due_at, now):
+        match = self.matches.get(match_id)
+        if match is None or match.match_ended or not match.is_live:
+            self._drop(match_id)
+            return
+        # Keep a steady rhythm, but never try to catch up on missed balls
+        self._schedule(match_id, max(due_at + match.seconds_per_ball, now))
+
+    def _drop(self, match_id):
+        if self.matches.pop(match_id, None) is not None:
+            self.lease.release([match_id])
+        self.due.pop(match_id, None)
+        self._evict(match_id)
+
+    def _evict(self, match_id):
+        if match_id in self.in_flight:
+            self.stale.add(match_id)
+        else:
+            self.engine.evict(match_id)
+
+
+class AsyncBallScheduler(BallScheduler):
+    """
+    The same scheduler hosted on the ASGI server's event loop (see
+    simulator/lifespan.py). Queries and ball simulation run on one dedicated
+    executor thread, so the scheduler keeps a single database connection
+    and the loop never blocks. The group messages of each tick go into an
+    outbox that a separate task drains in batches with
+    channel_layer.group_send, directly on the loop, so a slow channel layer
+    never holds up the next tick. Like Broadcaster's queue, the outbox is
+    bounded and drops the oldest messages when full.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='simulation')
+        # Filled by the executor and, with `threads` > 1, the pool threads
+        self.updates = deque()
+        self.outbox = deque(maxlen=getattr(settings, 'BROADCAST_QUEUE_SIZE', 10000))
+        self.batch_size = getattr(settings, 'BROADCAST_BATCH_SIZE', 500)
+        self.loop = None
+        self.wakeup = None
+        self.outbox_ready = None
+
+    def _wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.outbox_ready = asyncio.Event()
+        events.add_listener(self.notify)
+        listening = asyncio.ensure_future(self._listen())
+        broadcasting = asyncio.ensure_future(self._broadcast(get_channel_layer()))
+        try:
+            while True:
+                self.wakeup.clear()
+                try:
+                    updates = await self.loop.run_in_executor(self.executor, self._tick)
+                    if updates:
+                        self.outbox.extend(updates)
+                        self.outbox_ready.set()
+                    delay = self.next_delay()
+                except Exception as e:
+                    self.log(f"Scheduler error: {e}")
+                    delay = 1.0
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            listening.cancel()
+            broadcasting.cancel()
+            events.remove_listener(self.notify)
+            self.loop = None
+            self.executor.submit(self.release_all)
+            self.executor.submit(close_old_connections)
+            self.executor.shutdown(wait=False)
+
+    async def _broadcast(self, channel_layer):
+        while True:
+            await self.outbox_ready.wait()
+            self.outbox_ready.clear()
+            while self.outbox:
+                batch = [self.outbox.popleft() for _ in range(min(len(self.outbox), self.batch_size))]
+                try:
+                    await send_updates(channel_layer, batch)
+                except Exception as e:
+                    self.log(f"Broadcast error: {e}")
+
+    async def _listen(self):
+        while True:
+            try:
+                await events.listen(self.notify)
+                return
+            except Exception as e:
+                self.log(f"Change listener error: {e}")
+                await asyncio.sleep(5)
+
+    def _tick(self):
+        # Runs on the executor thread
+        close_old_connections()
+        self.run_once()
+        return [self.updates.popleft() for _ in range(len(self.updates))]
+
+    def _simulate_chunk(self, matches):
+        self.updates.extend(self.engine.simulate_tick(matches, send=False, lease=self.lease))
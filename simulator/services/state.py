@@ -0,0 +1,281 @@
+import random
+from collections import deque
+from django.db import models
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from simulator.models import Match, Ball, InningsScore, BattingScore, BowlingScore
+from simulator.services.roster import MatchRoster
+
+# Columns the engine changes on rows it already holds, written with bulk_update
+UPDATE_FIELDS = {
+    Match: ['current_innings', 'match_ended', 'is_live'],
+    InningsScore: ['total_runs', 'total_wickets', 'total_overs', 'extra_runs', 'is_completed'],
+    BattingScore: ['runs', 'balls_faced', 'fours', 'sixes', 'strike_rate', 'is_out', 'dismissal_text', 'is_on_strike'],
+    BowlingScore: ['overs', 'maidens', 'runs_conceded', 'wickets', 'economy'],
+}
+
+
+def flush_states(states):
+    """
+    Write the queued Balls and score rows of every state with one bulk
+    statement per model, then clear the queues. Call inside a transaction.
+    """
+    balls = []
+    created = {}
+    updated = {}
+    for state in states:
+        balls.extend(state.pending_balls)
+        for obj in state.dirty.values():
+            target = created if obj.pk is None else updated
+            target.setdefault(type(obj), []).append(obj)
+
+    # New score rows need their primary keys back so later balls can update them
+    for model, objs in created.items():
+        if connection.features.can_return_rows_from_bulk_insert:
+            model.objects.bulk_create(objs)
+        else:
+            for obj in objs:
+                obj.save()
+    for model, objs in updated.items():
+        _update_rows(model, objs, UPDATE_FIELDS[model])
+    if balls:
+        _insert_balls(balls)
+
+    for state in states:
+        state.pending_balls = []
+        state.dirty = {}
+
+
+def _insert_balls(balls):
+    """
+    Insert Ball rows with a single executemany. Ball columns are plain ints,
+    bools, strings and FK ids, so this skips the per-value field preparation
+    that makes bulk_create the slowest step of a fast-forwarded match.
+    """
+    fields = [f for f in Ball._meta.concrete_fields if not f.primary_key]
+    timestamp = connection.ops.adapt_datetimefield_value(timezone.now())
+    columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = f"INSERT INTO {connection.ops.quote_name(Ball._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    attnames = [f.attname for f in fields]
+    rows = [
+        [timestamp if name == 'timestamp' else getattr(ball, name) for name in attnames]
+        for ball in balls
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _update_rows(model, objs, field_names):
+    """
+    Write the given columns of existing rows with a single executemany.
+    bulk_update builds a CASE WHEN per row and column instead, which costs
+    more CPU than the rest of a tick once dozens of matches are live.
+    Raises DatabaseError if a row is gone (e.g. the match was reset), so
+    the caller rolls back and reloads the state instead of losing writes.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    qn = connection.ops.quote_name
+    assignments = ", ".join(f"{qn(f.column)} = %s" for f in fields)
+    sql = f"UPDATE {qn(model._meta.db_table)} SET {assignments} WHERE {qn(model._meta.pk.column)} = %s"
+    rows = [
+        [f.get_db_prep_save(getattr(obj, f.attname), connection) for f in fields] + [obj.pk]
+        for obj in objs
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+        if cursor.rowcount != len(rows):
+            raise DatabaseError(f"Updated {cursor.rowcount} of {len(rows)} {model.__name__} rows")
+
+
+class InningsState:
+    """
+    Running totals for one innings, kept in memory so a ball never has to
+    re-read or re-count rows that the engine itself wrote.
+    """
+
+    def __init__(self, innings, innings_score):
+        self.innings = innings
+        self.innings_score = innings_score
+        self.deliveries = 0
+        self.legal_balls = 0
+
+        # player_id -> score row (model instances, saved by flush_states)
+        self.batting_scores = {}
+        self.bowling_scores = {}
+        self.bowler_legal_balls = {}
+
+        self.striker_id = None
+        self.non_striker_id = None
+
+        self.partnership_runs = 0
+        self.partnership_balls = 0
+
+        # Runs needed to win, for the second innings
+        self.target = None
+
+        # Append-only / bounded so their cost does not grow with the innings
+        self.fall_of_wickets = []
+        self.last_balls = deque(maxlen=6)
+        self.extras = {'wides': 0, 'no_balls': 0, 'byes': 0, 'leg_byes': 0}
+
+    @property
+    def team(self):
+        return self.innings_score.team
+
+    def record_extras(self, is_wide, is_no_ball, is_bye, is_leg_bye):
+        if is_wide:
+            self.extras['wides'] += 1
+        if is_no_ball:
+            self.extras['no_balls'] += 1
+        if is_bye:
+            self.extras['byes'] += 1
+        if is_leg_bye:
+            self.extras['leg_byes'] += 1
+
+
+class MatchState:
+    """
+    Per-match state for SimulationEngine.
+
+    Loaded from the database once (so a live match can be resumed after a
+    restart) and then advanced ball by ball in memory. Rows touched by a ball
+    are queued on the state and written by flush_states(); nothing is read back.
+    """
+
+    def __init__(self, match, roster=None, detached=False):
+        self.match_id = match.id
+        self.current_innings = match.current_innings
+        # Detached states (replays) never read or write Ball and score rows
+        self.detached = detached
+
+        # One stream per match, reseeded for every delivery from the match
+        # seed and the delivery's position, so a ball is reproducible no
+        # matter when or in which process it is bowled.
+        self.seed = match.seed
+        self.rng = random.Random()
+
+        # Teams, squads and names; shared with the engine's roster cache
+        self.roster = roster if roster is not None else MatchRoster(match)
+
+        # Deliveries bowled in the whole match; numbers the broadcasts
+        self.seq = 0
+        # Last payload broadcast, which the next ball's delta is taken against
+        self.last_payload = None
+
+        self.innings = None
+        self.pending_balls = []
+        self.dirty = {}
+
+    @classmethod
+    def load(cls, match, roster=None):
+        state = cls(match, roster)
+        state.seq = Ball.objects.filter(match=match).count()
+        state.innings = state._load_innings(match, match.current_innings)
+        return state
+
+    @classmethod
+    def start(cls, match, roster=None):
+        """A detached state at the first ball of the match, for replays."""
+        state = cls(match, roster, detached=True)
+        state.current_innings = 1
+        state.innings = state._load_innings(match, 1)
+        return state
+
+    @property
+    def players(self):
+        return self.roster.players
+
+    def begin_delivery(self):
+        innings = self.innings
+        self.rng.seed((self.seed << 32) | (innings.innings << 24) | innings.deliveries)
+
+    def batting_team(self, innings):
+        return self.roster.batting_team(innings)
+
+    def bowling_team(self, innings):
+        return self.roster.bowling_team(innings)
+
+    def begin_innings(self, match):
+        self.current_innings = match.current_innings
+        self.innings = self._load_innings(match, match.current_innings)
+
+    def mark_dirty(self, obj):
+        self.dirty[id(obj)] = obj
+
+    def _load_innings(self, match, innings):
+        if self.detached:
+            state = InningsState(innings, InningsScore(match=match, team=self.batting_team(innings), innings=innings))
+            if innings > 1:
+                state.target = self.innings.innings_score.total_runs + 1
+            return state
+
+        innings_score, _ = InningsScore.objects.get_or_create(
+            match=match,
+            team=self.batting_team(innings),
+            innings=innings,
+        )
+        state = InningsState(innings, innings_score)
+        if innings > 1:
+            if self.innings is not None and self.innings.innings == innings - 1:
+                previous_runs = self.innings.innings_score.total_runs
+            else:
+                previous_runs = InningsScore.objects.filter(
+                    match=match, innings=innings - 1
+                ).values_list('total_runs', flat=True).first() or 0
+            state.target = previous_runs + 1
+
+        balls = Ball.objects.filter(match=match, innings=innings)
+        legal = balls.filter(is_wide=False, is_no_ball=False)
+        state.legal_balls = legal.count()
+        for row in legal.values('bowler_id').annotate(n=models.Count('id')):
+            state.bowler_legal_balls[row['bowler_id']] = row['n']
+
+        for score in BowlingScore.objects.filter(match=match, innings=innings):
+            state.bowling_scores[score.player_id] = score
+
+        active = []
+        for score in BattingScore.objects.filter(match=match, innings=innings).order_by('id'):
+            state.batting_scores[score.player_id] = score
+            if not score.is_out:
+                active.append(score)
+        on_strike = [s for s in active if s.is_on_strike]
+        if on_strike:
+            state.striker_id = on_strike[0].player_id
+            others = [s for s in active if s.player_id != state.striker_id]
+            state.non_striker_id = others[0].player_id if others else None
+        elif len(active) >= 2:
+            state.striker_id = active[0].player_id
+            state.non_striker_id = active[1].player_id
+        elif active:
+            # Striker was dismissed; the incoming batter takes strike
+            state.non_striker_id = active[0].player_id
+
+        total = 0
+        last_wicket_id = None
+        rows = balls.order_by('id').values(
+            'id', 'total_runs', 'is_wicket', 'dismissed_player_id', 'over_number', 'ball_number',
+            'is_wide', 'is_no_ball', 'is_bye', 'is_leg_bye',
+        )
+        for b in rows:
+            state.deliveries += 1
+            total += b['total_runs']
+            state.record_extras(b['is_wide'], b['is_no_ball'], b['is_bye'], b['is_leg_bye'])
+            state.last_balls.append({
+                'over': float(f"{b['over_number']}.{b['ball_number']}"),
+                'runs': b['total_runs'],
+            })
+            if b['is_wicket']:
+                last_wicket_id = b['id']
+                state.fall_of_wickets.append({
+                    'score': total,
+                    'wicket': len(state.fall_of_wickets) + 1,
+                    'player_id': b['dismissed_player_id'],
+                    'name': self.roster.name(b['dismissed_player_id']),
+                    'over': float(f"{b['over_number']}.{b['ball_number']}"),
+                })
+
+        since = balls.filter(id__gt=last_wicket_id) if last_wicket_id else balls
+        state.partnership_runs = since.aggregate(total=models.Sum('total_runs')).get('total') or 0
+        state.partnership_balls = since.filter(is_wide=False, is_no_ball=False).count()
+        return state
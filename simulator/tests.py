@@ -1,12 +1,41 @@
-from django.test import TestCase
+import copy
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 
 from simulator.models import Match, Ball, InningsScore, Tournament
 from simulator.services.generator import create_dummy_match, setup_match_squads, get_or_create_default_tournament
 from simulator.services.engine import SimulationEngine
+from simulator.services.state import MatchState
+from simulator.services.outcomes import OUTCOMES, WEIGHTS, AliasTable, sample_outcome
+from simulator.services.montecarlo import MonteCarloEngine
+from simulator.services.projections import project
+from simulator.services.replay import ReplayEngine
+from simulator.services.delta import diff, apply
+from simulator.services.live_store import get_live_store
+from simulator.routing import websocket_urlpatterns
+from simulator.authentication import token_cache
+from simulator.consumers import MatchStream
+from simulator.services.scheduler import BallScheduler, AsyncBallScheduler
+from simulator.services.leases import MatchLease
+from simulator.services import events
+from simulator.services.broadcaster import Broadcaster, send_updates
+from simulator.lifespan import SimulationLifespan
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
 
 
 class LiveMatchFlowTests(TestCase):
@@ -60,6 +89,23 @@ class LiveMatchFlowTests(TestCase):
         self.assertEqual(Ball.objects.filter(match=match).count(), 0)
         self.assertEqual(InningsScore.objects.filter(match=match).count(), 0)
 
+    def test_fast_forward_completes_match(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+
+        resp = self.client.post(f"/api/v1/match/{match.id}/fast_forward/")
+        self.assertEqual(resp.status_code, 200)
+
+        match.refresh_from_db()
+        self.assertTrue(match.match_ended)
+        self.assertFalse(match.is_live)
+        for score in InningsScore.objects.filter(match=match):
+            self.assertTrue(score.is_completed)
+            self.assertEqual(score.total_wickets, 10)
+            balls = Ball.objects.filter(match=match, innings=score.innings)
+            self.assertEqual(score.total_runs, sum(balls.values_list('total_runs', flat=True)))
+        self.assertEqual(InningsScore.objects.filter(match=match).count(), 2)
+
     def test_speed_change(self):
         match = create_dummy_match()
         setup_match_squads(match)
@@ -89,6 +135,478 @@ class SimulationEngineTests(TestCase):
         self.assertIsNotNone(score)
         self.assertGreaterEqual(score.total_runs, 0)
 
+    def test_in_memory_state_matches_database(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        engine = SimulationEngine()
+        for _ in range(60):
+            engine.simulate_ball(match)
+
+        live = engine.get_state(match).innings
+        reloaded = MatchState.load(match).innings
+        self.assertEqual(live.legal_balls, reloaded.legal_balls)
+        self.assertEqual(live.striker_id, reloaded.striker_id)
+        self.assertEqual(live.non_striker_id, reloaded.non_striker_id)
+        self.assertEqual(live.partnership_runs, reloaded.partnership_runs)
+        self.assertEqual(live.partnership_balls, reloaded.partnership_balls)
+        self.assertEqual(live.fall_of_wickets, reloaded.fall_of_wickets)
+        self.assertEqual(live.bowler_legal_balls, reloaded.bowler_legal_balls)
+
+        score = InningsScore.objects.get(match=match, innings=match.current_innings)
+        total = sum(Ball.objects.filter(match=match, innings=match.current_innings).values_list('total_runs', flat=True))
+        self.assertEqual(score.total_runs, total)
+
+    def test_roster_loaded_once_per_match(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        engine = SimulationEngine()
+        engine.simulate_ball(match)
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(12):
+                engine.simulate_ball(match)
+        tables = ('simulator_playingsquad', 'simulator_team', 'simulator_player', 'simulator_tournament')
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if any(t in q['sql'] for t in tables)])
+
+        match.match_ended = True
+        engine._release_if_finished(match)
+        self.assertNotIn(match.id, engine.rosters)
+
+    def test_writes_to_deleted_rows_fail_instead_of_vanishing(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        engine = SimulationEngine()
+        for _ in range(5):
+            engine.simulate_ball(match)
+        # Its score rows go behind the engine's back, as in a reset
+        InningsScore.objects.filter(match=match).delete()
+        with self.assertRaises(DatabaseError):
+            engine.simulate_ball(match)
+        self.assertNotIn(match.id, engine.states)
+        self.assertEqual(Ball.objects.filter(match=match).count(), 5)
+
+    def test_deltas_rebuild_full_payloads(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        get_live_store().add_viewer(match.id)
+
+        broadcaster = Broadcaster()
+        engine = SimulationEngine(broadcaster=broadcaster)
+        client = None
+        for _ in range(30):
+            # Queued for the broadcaster only once the ball is committed
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                engine.simulate_ball(match)
+                self.assertEqual(len(broadcaster.queue), 0)
+            self.assertEqual(len(callbacks), 1)
+            [message] = broadcaster.take(0)
+            payload = json.loads(message['text'])
+            if client is None:
+                self.assertIsNone(message['delta_text'])
+                client = payload
+            else:
+                delta = json.loads(message['delta_text'])
+                self.assertEqual((delta['type'], delta['seq']), ('BALL_DELTA', message['seq']))
+                self.assertNotIn('teams', delta['changes'])
+                apply(client, delta['changes'])
+                client['seq'] = delta['seq']
+            self.assertEqual(client, payload)
+
+        # A client connecting now gets the same state from the database
+        self.assertEqual(engine.build_snapshot(match), (30, payload))
+        self.assertEqual(get_live_store().get_snapshot(match.id), (30, message['text']))
+        get_live_store().remove_viewer(match.id)
+
+
+    def test_replay_reproduces_stored_balls(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        # Two engines, as if the worker restarted halfway through
+        first = SimulationEngine()
+        for _ in range(40):
+            first.simulate_ball(match)
+        second = SimulationEngine()
+        for _ in range(40):
+            second.simulate_ball(match)
+
+        fields = ['innings', 'over_number', 'ball_number', 'striker_id', 'bowler_id', 'total_runs', 'is_wide', 'is_wicket']
+        stored = list(Ball.objects.filter(match=match).order_by('id').values_list(*fields))
+        replayed = [tuple(getattr(b, f) for f in fields) for b in ReplayEngine().replay(match, len(stored))]
+        self.assertEqual(replayed, stored)
+
+    def test_fast_forward_is_deterministic(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        balls = SimulationEngine().simulate_match(match)
+
+        replayed = ReplayEngine().replay(match)
+        self.assertEqual(len(replayed), balls)
+        stored = list(Ball.objects.filter(match=match).order_by('id').values_list('total_runs', 'is_wicket', 'bowler_id'))
+        self.assertEqual([(b.total_runs, b.is_wicket, b.bowler_id) for b in replayed], stored)
+
+    def test_tick_simulates_every_due_match(self):
+        matches = []
+        for _ in range(3):
+            match = create_dummy_match()
+            setup_match_squads(match)
+            match.is_live = True
+            match.save()
+            matches.append(match)
+
+        engine = SimulationEngine()
+        for _ in range(12):
+            engine.simulate_tick(matches)
+
+        for match in matches:
+            balls = Ball.objects.filter(match=match)
+            self.assertEqual(balls.count(), 12)
+            score = InningsScore.objects.get(match=match, innings=1)
+            self.assertEqual(score.total_runs, sum(balls.values_list('total_runs', flat=True)))
+            self.assertEqual(engine.get_state(match).innings.legal_balls, MatchState.load(match).innings.legal_balls)
+
+
+class BallSchedulerTests(TestCase):
+    def test_balls_follow_each_matchs_interval(self):
+        fast, slow = create_dummy_match(), create_dummy_match()
+        for match, seconds in ((fast, 0.25), (slow, 1.0)):
+            setup_match_squads(match)
+            match.is_live = True
+            match.seconds_per_ball = seconds
+            match.save()
+
+        now = [0.0]
+        scheduler = BallScheduler(reconcile_interval=10.0, clock=lambda: now[0], log=lambda msg: None)
+        # Both matches get their first ball straight away
+        self.assertEqual(scheduler.run_once(), 0.25)
+        self.assertEqual(Ball.objects.filter(match__in=[fast, slow]).count(), 2)
+
+        with self.assertNumQueries(0):
+            for _ in range(3): # Nothing due yet: no work, no queries
+                scheduler.run_once()
+
+        for step in range(1, 9):
+            now[0] = step * 0.25
+            scheduler.run_once()
+        self.assertEqual(Ball.objects.filter(match=fast).count(), 9)
+        self.assertEqual(Ball.objects.filter(match=slow).count(), 3)
+        self.assertEqual(scheduler.run_once(), 0.25)
+
+        # Paused matches drop out when the scheduler is notified
+        Match.objects.filter(id=slow.id).update(is_live=False)
+        scheduler.notify()
+        now[0] = 3.0
+        scheduler.run_once()
+        self.assertEqual(set(scheduler.matches), {fast.id})
+        self.assertEqual(Ball.objects.filter(match=slow).count(), 3)
+
+
+    def test_each_match_runs_on_one_worker(self):
+        matches = [create_dummy_match() for _ in range(4)]
+        for match in matches:
+            setup_match_squads(match)
+            match.is_live = True
+            match.save()
+
+        def worker(owner, shard):
+            lease = MatchLease(owner=owner, shard=shard, shards=2)
+            return BallScheduler(clock=lambda: 0.0, log=lambda msg: None, lease=lease)
+
+        workers = [worker('a', 0), worker('b', 1)]
+        for scheduler in workers:
+            scheduler.run_once()
+        for scheduler, shard in zip(workers, (0, 1)):
+            self.assertEqual(set(scheduler.matches), {m.id for m in matches if m.id % 2 == shard})
+        # A second worker on the same shard finds everything taken
+        self.assertEqual(worker('c', 0).lease.claim([m.id for m in matches]), set())
+        for match in matches:
+            self.assertEqual(Ball.objects.filter(match=match).count(), 1)
+
+        # Worker b dies: once its leases have been expired for a lease period, a takes over
+        Match.objects.filter(lease_owner='b').update(lease_expires=timezone.now() - timedelta(minutes=2))
+        workers[0].notify()
+        workers[0].run_once()
+        self.assertEqual(set(workers[0].matches), {m.id for m in matches})
+
+        workers[0].release_all()
+        self.assertFalse(Match.objects.exclude(lease_owner='').exists())
+
+    def test_released_matches_can_be_taken_over(self):
+        home, other = create_dummy_match(), create_dummy_match()
+        if home.id % 2:
+            home, other = other, home
+        ids = [home.id, other.id]
+        a = MatchLease(owner='a', shard=0, shards=2)
+        b = MatchLease(owner='b', shard=1, shards=2)
+
+        def one_lease_period_later():
+            Match.objects.filter(id__in=ids).update(lease_expires=timezone.now() - timedelta(minutes=2))
+
+        # Never leased: the other shard's worker waits a lease period, then takes it over
+        self.assertEqual(a.claim(ids), {home.id})
+        one_lease_period_later()
+        self.assertEqual(a.claim(ids), {home.id, other.id})
+
+        # Released on pause: free for its own shard at once, for others after a lease period
+        a.release(ids)
+        self.assertEqual(b.claim(ids), {other.id})
+        b.release(ids)
+        self.assertEqual(b.claim([home.id]), set())
+        one_lease_period_later()
+        self.assertEqual(b.claim(ids), {home.id, other.id})
+
+        # Handed over on shutdown: any shard can take them straight away
+        b.release(ids, handover=True)
+        self.assertEqual(a.claim(ids), {home.id, other.id})
+
+    def test_a_worker_that_lost_its_lease_writes_nothing(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        now = [0.0]
+        scheduler = BallScheduler(clock=lambda: now[0], log=lambda msg: None, lease=MatchLease(owner='a'))
+        scheduler.run_once()
+        self.assertEqual(Ball.objects.filter(match=match).count(), 1)
+
+        # The worker stalled and another took over before it bowled the next ball
+        Match.objects.filter(id=match.id).update(lease_owner='b', lease_expires=timezone.now() + timedelta(minutes=1))
+        now[0] = match.seconds_per_ball
+        scheduler.run_once()
+        self.assertEqual(Ball.objects.filter(match=match).count(), 1)
+        self.assertNotIn(match.id, scheduler.engine.states)
+
+    def test_admin_actions_reach_the_scheduler_at_once(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        client = APIClient()
+        user = User.objects.create_user(username="tester", password="pass123")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+
+        # No periodic reconcile during the test: only change events can reach it
+        scheduler = BallScheduler(reconcile_interval=60.0, clock=lambda: 0.0, log=lambda msg: None)
+        scheduler.run_once()
+        events.add_listener(scheduler.notify)
+        self.addCleanup(events.remove_listener, scheduler.notify)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f"/api/v1/match/{match.id}/start/")
+        scheduler.run_once()
+        self.assertEqual(set(scheduler.matches), {match.id})
+        self.assertEqual(Ball.objects.filter(match=match).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f"/api/v1/match/{match.id}/pause/")
+        scheduler.run_once()
+        self.assertEqual(scheduler.matches, {})
+        self.assertNotIn(match.id, scheduler.engine.states)
+
+    def test_reconcile_notices_a_reset_without_an_event(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        client = APIClient()
+        user = User.objects.create_user(username="tester", password="pass123")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+
+        now = [0.0]
+        scheduler = BallScheduler(reconcile_interval=5.0, clock=lambda: now[0], log=lambda msg: None)
+        for step in range(10):
+            now[0] = float(step)
+            scheduler.run_once()
+        self.assertEqual(Ball.objects.filter(match=match).count(), 10)
+
+        # Reset and restarted elsewhere; the change event is lost, so only the reconcile sees it
+        client.post(f"/api/v1/match/{match.id}/reset/")
+        client.post(f"/api/v1/match/{match.id}/start/")
+        now[0] = 10.0
+        scheduler.run_once()
+
+        ball = Ball.objects.get(match=match)
+        self.assertEqual((ball.innings, ball.over_number), (1, 0))
+        score = InningsScore.objects.get(match=match, innings=1)
+        self.assertEqual(score.total_runs, ball.total_runs)
+
+    def test_fast_forward_waits_for_the_scheduler(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        client = APIClient()
+        user = User.objects.create_user(username="tester", password="pass123")
+        client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+
+        get_live_store().add_viewer(match.id)
+        self.addCleanup(get_live_store().remove_viewer, match.id)
+
+        now = [0.0]
+        scheduler = BallScheduler(reconcile_interval=60.0, clock=lambda: now[0], log=lambda msg: None)
+        scheduler.run_once()
+        events.add_listener(scheduler.notify)
+        self.addCleanup(events.remove_listener, scheduler.notify)
+        self.assertEqual(get_live_store().get_snapshot(match.id)[0], 1)
+
+        resp = client.post(f"/api/v1/match/{match.id}/fast_forward/")
+        self.assertEqual(resp.status_code, 400)
+
+        # Paused, but the scheduler has not heard yet and still holds the match
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.post(f"/api/v1/match/{match.id}/pause/")
+        resp = client.post(f"/api/v1/match/{match.id}/fast_forward/")
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(Ball.objects.filter(match=match).count(), 1)
+
+        for callback in callbacks:
+            callback()
+        scheduler.run_once()
+        resp = client.post(f"/api/v1/match/{match.id}/fast_forward/")
+        self.assertEqual(resp.status_code, 200)
+        match.refresh_from_db()
+        self.assertTrue(match.match_ended)
+        # The stored ball-1 state is gone, so clients load the finished match instead
+        self.assertIsNone(get_live_store().get_snapshot(match.id))
+        self.assertIsNone(get_live_store().balls_since(match.id, 1))
+
+        # Its next tick finds nothing left to bowl
+        balls = Ball.objects.filter(match=match).count()
+        now[0] = 5.0
+        scheduler.notify(match.id)
+        scheduler.run_once()
+        self.assertEqual(Ball.objects.filter(match=match).count(), balls)
+        self.assertEqual(scheduler.matches, {})
+
+    def test_threads_split_a_tick_without_splitting_a_match(self):
+        class RecordingEngine:
+            def __init__(self):
+                self.ticks = []
+
+            def simulate_tick(self, matches, **kwargs):
+                self.ticks.append([match.id for match in matches])
+
+        engine = RecordingEngine()
+        scheduler = BallScheduler(engine=engine, log=lambda msg: None, threads=3)
+        scheduler.matches = {i: Match(id=i) for i in range(1, 8)}
+        scheduler._simulate([(i, 0.0) for i in range(1, 8)], 0.0)
+        scheduler.pool.shutdown() # Waits for the chunks
+        self.assertEqual(len(engine.ticks), 3)
+        self.assertEqual(sorted(sum(engine.ticks, [])), list(range(1, 8)))
+        self.assertEqual(len(scheduler.completed), 3)
+
+    def test_a_slow_match_does_not_hold_up_the_others(self):
+        matches = [create_dummy_match() for _ in range(3)]
+        for match in matches:
+            match.is_live = True
+            match.save()
+        slow = matches[0].id
+
+        class BlockingEngine:
+            def __init__(self):
+                self.ticks = []
+                self.unblock = threading.Event()
+
+            def simulate_tick(self, matches, **kwargs):
+                ids = [match.id for match in matches]
+                if slow in ids:
+                    self.unblock.wait(5)
+                self.ticks.append(ids)
+
+            def evict(self, match_id):
+                pass
+
+        engine = BlockingEngine()
+        now = [0.0]
+        scheduler = BallScheduler(engine=engine, reconcile_interval=60.0, clock=lambda: now[0], log=lambda msg: None, threads=3)
+        self.addCleanup(scheduler.pool.shutdown)
+        self.addCleanup(engine.unblock.set)
+
+        def wait_for(finished):
+            for _ in range(500):
+                if len(scheduler.completed) == finished:
+                    break
+                time.sleep(0.01)
+
+        def tick(at, finished):
+            now[0] = at
+            scheduler.run_once()
+            wait_for(finished)
+
+        # The slow match's first ball is stuck; the others keep bowling every second
+        tick(0.0, 2)
+        tick(1.0, 2)
+        tick(2.0, 2)
+        scheduler.run_once() # Takes the finished chunks back; nothing else is due yet
+        balls = Counter(sum(engine.ticks, []))
+        self.assertEqual(balls, {match.id: 3 for match in matches[1:]})
+        self.assertEqual(set(scheduler.in_flight), {slow})
+
+        # Once back it bowls straight away, without catching up on the balls it missed
+        engine.unblock.set()
+        wait_for(1)
+        now[0] = 2.5
+        scheduler.run_once()
+        self.assertEqual(scheduler.in_flight, {slow: 2.5})
+        scheduler.pool.shutdown()
+        self.assertEqual(Counter(sum(engine.ticks, []))[slow], 2)
+
+    def test_async_scheduler_leaves_sending_to_the_event_loop(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        get_live_store().add_viewer(match.id)
+        self.addCleanup(get_live_store().remove_viewer, match.id)
+
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'match_{match.id}', channel)
+
+        scheduler = AsyncBallScheduler(clock=lambda: 0.0, log=lambda msg: None)
+        self.addCleanup(scheduler.executor.shutdown)
+        scheduler.run_once()
+        self.assertEqual([update['seq'] for update in scheduler.updates], [1])
+
+        async def deliver(updates):
+            await send_updates(channel_layer, updates)
+            return await asyncio.wait_for(channel_layer.receive(channel), 1)
+
+        message = async_to_sync(deliver)(scheduler.updates)
+        self.assertEqual(message['match_id'], match.id)
+        self.assertEqual(json.loads(message['text'])['seq'], 1)
+
+    def test_lifespan_without_async_scheduler(self):
+        app = SimulationLifespan(None)
+        app.enabled = False
+        sent = []
+
+        async def run():
+            events = asyncio.Queue()
+            for kind in ('lifespan.startup', 'lifespan.shutdown'):
+                events.put_nowait({'type': kind})
+
+            async def send(message):
+                sent.append(message['type'])
+
+            await app({'type': 'lifespan'}, events.get, send)
+
+        async_to_sync(run)()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNone(app.task)
+
 
 class TournamentEndpointTests(TestCase):
     def setUp(self):
@@ -118,3 +636,394 @@ class TournamentEndpointTests(TestCase):
         self.assertIn("live", payload)
         self.assertIn("upcoming", payload)
         self.assertTrue(any(t["code"] == tournament.code for t in payload["live"]))
+
+
+class MatchEndpointQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="tester", password="pass123")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.client.get("/api/v1/matches/live") # Caches the token
+
+    def add_live_match(self):
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        SimulationEngine().simulate_ball(match)
+        return match
+
+    def test_live_list_query_count_does_not_grow_with_matches(self):
+        # Matches (with their score) and teams
+        match = self.add_live_match()
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/v1/matches/live")
+        self.assertEqual(len(resp.json()["data"]), 1)
+
+        for _ in range(3):
+            self.add_live_match()
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/v1/matches/live")
+        data = resp.json()["data"]
+        self.assertEqual(len(data), 4)
+        self.assertLess(len(resp.content) / len(data), 1000)
+        for item in data:
+            self.assertEqual(len(item["teams"]), 2)
+            self.assertNotIn("squad", item["teams"][0])
+            self.assertEqual(item["score"]["runs"], InningsScore.objects.get(match_id=item["id"], innings=1).total_runs)
+
+        # Squads, players and nationalities only when asked for
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/v1/matches/live?expand=squads")
+        expanded = resp.json()["data"]
+        for item in expanded:
+            self.assertEqual([len(team["squad"]) for team in item["teams"]], [11, 11])
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(f"/api/v1/matches/{match.id}")
+        self.assertEqual(resp.json()["teams"], next(m for m in expanded if m["id"] == match.id)["teams"])
+
+    def test_sparse_fieldsets(self):
+        match = self.add_live_match()
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/v1/matches/live?fields=id,matchName,score,unknown")
+        [item] = resp.json()["data"]
+        self.assertEqual(set(item), {"id", "matchName", "score"})
+        self.assertEqual(item["matchName"], f"Match {match.id}")
+
+        resp = self.client.get(f"/api/v1/matches/{match.id}?fields=id,teams&expand=")
+        self.assertEqual(set(resp.json()), {"id", "teams"})
+        self.assertNotIn("squad", resp.json()["teams"][0])
+
+class OutcomeTableTests(TestCase):
+    def test_alias_table_matches_weights(self):
+        rng = random.Random(7)
+        for weights in WEIGHTS.values():
+            table = AliasTable(OUTCOMES, weights)
+            draws = 70000
+            counts = [0] * len(OUTCOMES)
+            for _ in range(draws):
+                counts[OUTCOMES.index(table.sample(rng))] += 1
+            total = sum(weights)
+            for count, weight in zip(counts, weights):
+                self.assertAlmostEqual(count / draws, weight / total, delta=0.01)
+
+
+class MatchConsumerTests(TestCase):
+    def test_v2_snapshot_comes_from_live_store(self):
+        # No such match in the database: the snapshot can only come from the store
+        user = User.objects.create_user(username="viewer", password="pass123")
+        get_live_store().set_snapshot(987654, 42, '{"type":"BALL_UPDATE"}')
+
+        async def connect():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/matches/987654/?v=2")
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        connected, message = async_to_sync(connect)()
+        self.assertTrue(connected)
+        self.assertEqual(message, {
+            'type': 'SNAPSHOT', 'version': 2, 'matchId': 987654, 'seq': 42, 'payload': {'type': 'BALL_UPDATE'},
+        })
+        get_live_store().clear(987654)
+
+
+    def test_reconnect_backfills_missed_balls(self):
+        user = User.objects.create_user(username="viewer", password="pass123")
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+        get_live_store().add_viewer(match.id)
+        engine = SimulationEngine()
+        for _ in range(20):
+            engine.simulate_ball(match)
+
+        async def connect(query, count):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/matches/{match.id}/?{query}")
+            communicator.scope['user'] = user
+            await communicator.connect()
+            messages = [await communicator.receive_json_from() for _ in range(count)]
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return messages
+
+        deltas = async_to_sync(connect)("v=2&since=15", 5)
+        self.assertEqual([(m['type'], m['seq']) for m in deltas], [('BALL_DELTA', seq) for seq in range(16, 21)])
+
+        updates = async_to_sync(connect)("since=18", 2)
+        self.assertEqual([(m['type'], m['seq']) for m in updates], [('BALL_UPDATE', 19), ('BALL_UPDATE', 20)])
+
+        # A v1 client connecting afresh gets the latest full update at once
+        latest = async_to_sync(connect)("", 1)
+        self.assertEqual((latest[0]['type'], latest[0]['seq']), ('BALL_UPDATE', 20))
+
+        # The first ball after the engine started has no delta to chain from
+        snapshot = async_to_sync(connect)("v=2&since=0", 1)
+        self.assertEqual((snapshot[0]['type'], snapshot[0]['seq']), ('SNAPSHOT', 20))
+        get_live_store().remove_viewer(match.id)
+
+    def test_unwatched_matches_build_no_payload(self):
+        user = User.objects.create_user(username="viewer", password="pass123")
+        match = create_dummy_match()
+        setup_match_squads(match)
+        match.is_live = True
+        match.save()
+
+        class CountingEngine(SimulationEngine):
+            built = 0
+
+            def _build_delivery_payload(self, match, delivery):
+                CountingEngine.built += 1
+                return super()._build_delivery_payload(match, delivery)
+
+        engine = CountingEngine()
+        get_live_store().add_viewer(match.id)
+        engine.simulate_ball(match)
+        get_live_store().remove_viewer(match.id)
+        for _ in range(9):
+            engine.simulate_ball(match)
+        self.assertEqual(CountingEngine.built, 1)
+        self.assertIsNone(get_live_store().get_snapshot(match.id))
+
+        async def connect():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/matches/{match.id}/?v=2")
+            communicator.scope['user'] = user
+            await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        # The first viewer gets the current state at once, rebuilt from the database
+        snapshot = async_to_sync(connect)()
+        self.assertEqual((snapshot['type'], snapshot['seq'], snapshot['payload']['seq']), ('SNAPSHOT', 10, 10))
+
+
+    def test_multiplexed_subscriptions(self):
+        user = User.objects.create_user(username="viewer", password="pass123")
+
+        def update(match_id, seq):
+            return {
+                'type': 'match_update', 'match_id': match_id, 'seq': seq,
+                'text': json.dumps({'type': 'BALL_UPDATE', 'matchId': match_id, 'seq': seq}), 'delta_text': None,
+            }
+
+        async def follow():
+            layer = get_channel_layer()
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/matches/")
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            received = []
+            for match_id in (801, 802):
+                await communicator.send_json_to({'action': 'subscribe', 'match_id': match_id})
+                received.append(await communicator.receive_json_from())
+
+            await layer.group_send('match_801', update(801, 1))
+            await layer.group_send('match_802', update(802, 1))
+            received.append(await communicator.receive_json_from())
+            received.append(await communicator.receive_json_from())
+
+            await communicator.send_json_to({'action': 'unsubscribe', 'match_id': 801})
+            received.append(await communicator.receive_json_from())
+            await layer.group_send('match_801', update(801, 2))
+            await layer.group_send('match_802', update(802, 2))
+            received.append(await communicator.receive_json_from())
+            self.assertTrue(await communicator.receive_nothing())
+
+            await communicator.send_json_to({'action': 'subscribe'})
+            received.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return received
+
+        received = async_to_sync(follow)()
+        self.assertEqual([(m['type'], m['matchId']) for m in received], [
+            ('SUBSCRIBED', 801), ('SUBSCRIBED', 802),
+            ('BALL_UPDATE', 801), ('BALL_UPDATE', 802),
+            ('UNSUBSCRIBED', 801), ('BALL_UPDATE', 802),
+            ('ERROR', None),
+        ])
+
+
+class Socket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, text_data=None):
+        self.frames.append(json.loads(text_data))
+
+
+def stream_event(seq, delta=True):
+    payload = {'type': 'BALL_UPDATE', 'seq': seq}
+    delta_text = json.dumps({'type': 'BALL_DELTA', 'seq': seq, 'changes': {'seq': seq}}) if delta else None
+    return {'match_id': 7, 'seq': seq, 'text': json.dumps(payload), 'delta_text': delta_text}
+
+
+class MatchStreamTests(TestCase):
+    @override_settings(WS_MAX_UPDATES_PER_SECOND=20)
+    def test_fast_balls_are_coalesced(self):
+        event = stream_event
+
+        async def play(version):
+            socket = Socket()
+            stream = MatchStream(socket, 7, version)
+            stream.seq = 1
+            for seq in range(2, 7):
+                await stream.update(event(seq))
+            await asyncio.sleep(0.1)
+            await stream.update(event(7))
+            await asyncio.sleep(0.1)
+            stream.close()
+            return [(f['type'], f['seq']) for f in socket.frames]
+
+        # One frame per 50ms window: the first ball, the four that queued behind it, the last
+        self.assertEqual(async_to_sync(play)(2), [('BALL_DELTA', 2), ('SNAPSHOT', 6), ('BALL_DELTA', 7)])
+        self.assertEqual(async_to_sync(play)(1), [('BALL_UPDATE', 2), ('BALL_UPDATE', 6), ('BALL_UPDATE', 7)])
+
+    def test_ball_already_in_the_snapshot_is_not_sent_again(self):
+        async def play(version):
+            socket = Socket()
+            stream = MatchStream(socket, 7, version)
+            # Connected between record_ball and the group send of a ball the
+            # engine had nothing to diff against (first ball after a reload)
+            stream.seq = 5
+            await stream.update(stream_event(5, delta=False))
+            stream.last_sent = 0.0
+            # A reset match starts again at seq 1 and still gets through
+            await stream.update(stream_event(1, delta=False))
+            stream.close()
+            return [(f['type'], f['seq']) for f in socket.frames]
+
+        self.assertEqual(async_to_sync(play)(2), [('SNAPSHOT', 1)])
+        self.assertEqual(async_to_sync(play)(1), [('BALL_UPDATE', 1)])
+
+    @override_settings(WS_MAX_UPDATES_PER_SECOND=1)
+    def test_only_the_newest_held_ball_is_kept(self):
+        async def play():
+            socket = Socket()
+            stream = MatchStream(socket, 7, 2)
+            stream.seq = 9
+            for seq in range(10, 510):
+                await stream.update(stream_event(seq))
+            held = stream.pending
+            # A reset among the held balls still gets the client a snapshot
+            await stream.update(stream_event(1, delta=False))
+            await stream.update(stream_event(2))
+            resync = stream.pending_resync
+            stream.close()
+            await stream.flush()
+            return held, resync, [(f['type'], f['seq']) for f in socket.frames]
+
+        held, resync, frames = async_to_sync(play)()
+        self.assertEqual(held['seq'], 509)
+        self.assertTrue(resync)
+        self.assertEqual(frames, [('BALL_DELTA', 10), ('SNAPSHOT', 2)])
+
+
+class BroadcasterTests(TestCase):
+    def test_outbox_sends_in_batches_and_drops_the_oldest(self):
+        logged = []
+        broadcaster = Broadcaster(max_size=5, batch_size=2, log=logged.append)
+        broadcaster.put([{'seq': seq} for seq in range(1, 8)])
+        self.assertEqual([m['seq'] for m in broadcaster.take(0)], [3, 4])
+        self.assertEqual(logged, ["Broadcast queue full: dropped 2 messages"])
+        self.assertEqual([m['seq'] for m in broadcaster.take(0)], [5, 6])
+        self.assertEqual([m['seq'] for m in broadcaster.take(0)], [7])
+        self.assertEqual(broadcaster.take(0), [])
+
+    def test_each_matchs_balls_are_sent_in_order(self):
+        class SlowLayer:
+            def __init__(self):
+                self.sent = []
+
+            async def group_send(self, group, message):
+                # Earlier balls take longer, so concurrent sends would arrive reversed
+                await asyncio.sleep(0.01 / message['seq'])
+                self.sent.append((group, message['seq']))
+
+        layer = SlowLayer()
+        updates = [{'match_id': match_id, 'seq': seq} for seq in range(1, 4) for match_id in (1, 2)]
+        async_to_sync(send_updates)(layer, updates)
+        for group in ("match_1", "match_2"):
+            self.assertEqual([seq for g, seq in layer.sent if g == group], [1, 2, 3])
+        # Matches still go out side by side
+        self.assertEqual({g for g, seq in layer.sent[:2]}, {"match_1", "match_2"})
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="cached", password="pass123")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_lookup_is_cached_until_deleted(self):
+        self.assertEqual(self.client.get("/api/v1/tournaments/").status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/api/v1/tournaments/").status_code, 200)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'authtoken_token' in q['sql']])
+
+        self.token.delete()
+        self.assertEqual(self.client.get("/api/v1/tournaments/").status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get("/api/v1/tournaments/").status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/v1/tournaments/").status_code, 401)
+
+
+class DeltaTests(TestCase):
+    def test_diff_and_apply(self):
+        old = {'score': {'runs': 10, 'wickets': 1}, 'balls': [1, 2], 'target': None, 'gone': 1}
+        new = {'score': {'runs': 14, 'wickets': 1}, 'balls': [2, 4], 'target': None, 'extra': {'a': 1}}
+        changes = diff(old, new)
+        self.assertEqual(changes, {'score': {'runs': 14}, 'balls': [2, 4], 'extra': {'a': 1}, 'gone': None})
+        self.assertEqual(diff(new, new), {})
+        patched = apply(copy.deepcopy(old), changes)
+        patched.pop('gone')
+        self.assertEqual(patched, new)
+
+
+class MonteCarloEngineTests(TestCase):
+    def _python_innings(self, rng):
+        runs = wickets = legal = 0
+        while wickets < 10:
+            outcome = sample_outcome(legal // 6, rng)
+            runs += outcome['runs'] + outcome['extras']
+            wickets += outcome['is_wicket']
+            if not outcome['is_wide']:
+                legal += 1
+        return runs, legal
+
+    def test_matches_ball_by_ball_model(self):
+        rng = random.Random(3)
+        python_runs, python_legal = zip(*(self._python_innings(rng) for _ in range(3000)))
+
+        result = MonteCarloEngine(seed=3).simulate_innings(3000)
+        self.assertTrue((result['wickets'] == 10).all())
+        self.assertTrue((result['legal_balls'] <= result['balls']).all())
+        self.assertAlmostEqual(result['runs'].mean() / (sum(python_runs) / 3000), 1.0, delta=0.05)
+        self.assertAlmostEqual(result['legal_balls'].mean() / (sum(python_legal) / 3000), 1.0, delta=0.05)
+
+    def test_target_and_seed(self):
+        first = MonteCarloEngine(seed=11).simulate_innings(500, runs=100, wickets=3, legal_balls=60, target=120)
+        again = MonteCarloEngine(seed=11).simulate_innings(500, runs=100, wickets=3, legal_balls=60, target=120)
+        self.assertTrue((first['runs'] == again['runs']).all())
+        chased = first['runs'] >= 120
+        self.assertTrue((first['wickets'][~chased] == 10).all())
+        self.assertTrue((first['runs'][chased] <= 125).all())
+
+    def test_projection_edges(self):
+        # The chase is batted out like the live engine does, past the target
+        projected, win, tie = project(2, 150, 3, 100, 150)
+        self.assertGreater(projected, 150)
+        self.assertEqual((win, tie), (1.0, 0.0))
+        self.assertEqual(project(2, 120, 10, 100, 150), (120, 0.0, 0.0))
+        projected, win, tie = project(1, 50, 2, 60)
+        self.assertGreater(projected, 50)
+        self.assertTrue(0.0 <= win <= 1.0 and 0.0 <= tie <= 1.0)
@@ -2,30 +2,49 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication
 from django.utils import timezone
 from .models import Match, Tournament
 from .serializers import MatchSerializer, TournamentSerializer
 
+def parse_list(value):
+    # "a,b" -> ['a', 'b']; None stays None (parameter not given)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def serialize_matches(request, queryset, many, expand=()):
+    """
+    Serialize matches honouring ?fields= (only these fields) and
+    ?expand=squads (include squads); `expand` applies when the request
+    has no ?expand= of its own.
+    """
+    fields = parse_list(request.query_params.get('fields'))
+    if 'expand' in request.query_params:
+        expand = parse_list(request.query_params['expand'])
+    matches = MatchSerializer.setup_eager_loading(queryset, fields=fields, expand=expand)
+    if not many:
+        matches = matches.get()
+    return MatchSerializer(matches, many=many, fields=fields, context={'expand': expand}).data
+
 class LiveMatchesView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Filter matches that are live
+        # Filter matches that are live; squads only with ?expand=squads
         matches = Match.objects.filter(is_live=True).order_by('-date')
-        serializer = MatchSerializer(matches, many=True)
-        return Response({"data": serializer.data})
+        return Response({"data": serialize_matches(request, matches, many=True)})
 
 class MatchDetailView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, match_id):
         try:
-            match = Match.objects.get(id=match_id)
-            serializer = MatchSerializer(match)
-            return Response(serializer.data)
+            # Full details, squads included, unless the request narrows them
+            data = serialize_matches(request, Match.objects.filter(id=match_id), many=False, expand=['squads'])
+            return Response(data)
         except Match.DoesNotExist:
             return Response({"error": "Match not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -35,7 +54,7 @@ class DebugLogView(APIView):
         return Response(global_debug_logs)
 
 class TournamentListView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -1,7 +1,11 @@
 from django.views.generic import TemplateView, View
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Match, Team, Ball, InningsScore, BattingScore, BowlingScore, PlayingSquad
+from .models import Match, Team, Ball, InningsScore, BattingScore, BowlingScore, PlayingSquad, generate_match_seed
 from .services.generator import create_dummy_match, setup_match_squads
+from .services.engine import SimulationEngine
+from .services.live_store import get_live_store
+from .services.events import publish_match_change
+from .services.leases import MatchLease
 
 class DashboardView(TemplateView):
     template_name = "simulator/dashboard.html"
@@ -21,11 +25,11 @@ from .models import Match, Team, Ball, InningsScore, BattingScore, BowlingScore,
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 class MatchActionView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, match_id, action):
@@ -39,11 +43,12 @@ class MatchActionView(APIView):
                 )
             match.is_live = True
             match.match_ended = False
-            match.save()
+            # Named fields only: a simulation worker may be renewing the lease columns
+            match.save(update_fields=['is_live', 'match_ended'])
             msg = "Match Started"
         elif action == 'pause':
             match.is_live = False
-            match.save()
+            match.save(update_fields=['is_live'])
             msg = "Match Paused"
         elif action == 'reset':
             match.is_live = False
@@ -51,6 +56,8 @@ class MatchActionView(APIView):
             match.current_innings = 1
             match.toss_won_by = None
             match.opt_to = None
+            match.seed = generate_match_seed()
+            get_live_store().clear(match.id)
             
             # Delete Related Data
             Ball.objects.filter(match=match).delete()
@@ -58,18 +65,45 @@ class MatchActionView(APIView):
             BattingScore.objects.filter(match=match).delete()
             BowlingScore.objects.filter(match=match).delete()
             
-            match.save()
+            match.save(update_fields=['is_live', 'match_ended', 'current_innings', 'toss_won_by', 'opt_to', 'seed'])
             msg = "Match Reset"
+        elif action == 'fast_forward':
+            if match.match_ended:
+                return Response(
+                    {"status": "error", "message": "Match already ended. Reset to start again."},
+                    status=400,
+                )
+            if match.is_live:
+                return Response(
+                    {"status": "error", "message": "Match is live. Pause it before fast-forwarding."},
+                    status=400,
+                )
+            # A scheduler may still hold a just-paused match until it hears of the pause
+            lease = MatchLease()
+            if match.id not in lease.claim([match.id]):
+                return Response(
+                    {"status": "error", "message": "Match is still being simulated. Try again shortly."},
+                    status=409,
+                )
+            try:
+                balls = SimulationEngine().simulate_match(match)
+            finally:
+                lease.release([match.id])
+            # Stored state is from before the pause; the next client reloads it from the database
+            get_live_store().clear(match.id)
+            msg = f"Match Completed ({balls} balls simulated)"
         elif action == 'speed':
             try:
                 speed = float(request.data.get('seconds_per_ball', 1.0))
                 match.seconds_per_ball = speed
-                match.save()
+                match.save(update_fields=['seconds_per_ball'])
                 msg = f"Speed set to {speed}"
             except ValueError:
                 return Response(
                     {"status": "error", "message": "Invalid speed"},
                     status=400,
                 )
-            
+
+        # The schedulers pick the change up now rather than on their next reconcile
+        publish_match_change(match.id)
         return Response({"status": "success", "message": msg})